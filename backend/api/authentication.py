@@ -0,0 +1,99 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_KEY = 'api:auth-token:{}'
+
+
+class TokenCache:
+    """Токен -> пользователь: LRU в памяти процесса и общий кэш за ним.
+
+    Запись в LRU живет AUTH_TOKEN_LOCAL_TTL секунд, в общем кэше
+    (AUTH_TOKEN_SHARED_CACHE) - AUTH_TOKEN_CACHE_TIMEOUT. Сигналы удаляют
+    записи при выходе, изменении и деактивации пользователя; другие
+    процессы видят это не позже чем через AUTH_TOKEN_LOCAL_TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    @staticmethod
+    def get_key(key):
+        return TOKEN_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        with self._lock:
+            item = self._users.get(key)
+            if item is not None:
+                user, expires = item
+                if time.monotonic() < expires:
+                    self._users.move_to_end(key)
+                    # Свою копию каждому запросу: потоки не делят объект.
+                    return copy.copy(user)
+                del self._users[key]
+        if not settings.AUTH_TOKEN_SHARED_CACHE:
+            return None
+        user = cache.get(self.get_key(key))
+        if user is not None:
+            self._remember(key, copy.copy(user))
+        return user
+
+    def set(self, key, user):
+        self._remember(key, copy.copy(user))
+        if settings.AUTH_TOKEN_SHARED_CACHE:
+            cache.set(
+                self.get_key(key), user, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+    def _remember(self, key, user):
+        if not settings.AUTH_TOKEN_CACHE_SIZE:
+            return
+        with self._lock:
+            self._users[key] = (
+                user, time.monotonic() + settings.AUTH_TOKEN_LOCAL_TTL)
+            self._users.move_to_end(key)
+            while len(self._users) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, keys):
+        """Удаляет записи сразу и еще раз после коммита.
+
+        Повторное удаление убирает то, что параллельный запрос успел
+        закэшировать из еще не закоммиченного состояния.
+        """
+
+        keys = list(keys)
+        if not keys:
+            return
+
+        def delete():
+            with self._lock:
+                for key in keys:
+                    self._users.pop(key, None)
+            if settings.AUTH_TOKEN_SHARED_CACHE:
+                cache.delete_many([self.get_key(key) for key in keys])
+
+        delete()
+        transaction.on_commit(delete)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к authtoken_token на каждый запрос."""
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is not None:
+            return user, self.get_model()(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user)
+        return user, token
@@ -0,0 +1,94 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK
+
+VERSION_KEY = 'api:anonymous:{}:version'
+LISTS_VERSION_KEY = 'api:lists:{}:version'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Начинаем с текущего времени, чтобы после вытеснения ключа
+        # версии не попасть на старые записи.
+        now = int(time.time() * 1000)
+        cache.add(key, now, None)
+        # DummyCache ничего не хранит: тогда версия каждый раз новая.
+        version = cache.get(key, now)
+    return version
+
+
+def _bump_versions(keys):
+    def bump():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, int(time.time() * 1000), None)
+
+    transaction.on_commit(bump)
+
+
+def get_version(namespace):
+    return _get_version(VERSION_KEY.format(namespace))
+
+
+def bump_version(namespace):
+    """Сбрасывает все закэшированные ответы пространства после коммита."""
+
+    _bump_versions([VERSION_KEY.format(namespace)])
+
+
+def get_lists_version(user_id):
+    """Версия избранного, корзины и подписок пользователя."""
+
+    return _get_version(LISTS_VERSION_KEY.format(user_id))
+
+
+def bump_lists_version(user_ids):
+    _bump_versions([LISTS_VERSION_KEY.format(pk) for pk in user_ids])
+
+
+def make_key(namespace, request):
+    """Ключ из пути и отсортированных параметров запроса."""
+
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key))
+    raw = f'{request.get_host()}{request.path}?{params}'
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'api:anonymous:{namespace}:{get_version(namespace)}:{digest}'
+
+
+def cache_anonymous(namespace):
+    """Кэширует данные успешных GET-ответов для анонимных пользователей.
+
+    Для анонима все аннотации (is_favorited и т.п.) одинаковы, поэтому
+    ответ зависит только от пути и параметров запроса.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if (
+                request.user.is_authenticated
+                or not settings.ANONYMOUS_CACHE_TIMEOUT
+            ):
+                return method(self, request, *args, **kwargs)
+            key = make_key(namespace, request)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == HTTP_200_OK:
+                cache.set(key, response.data, settings.ANONYMOUS_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
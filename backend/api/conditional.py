@@ -0,0 +1,59 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.status import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+
+from api.cache import get_lists_version
+
+
+def get_user_state(request):
+    """То, от чего зависят is_favorited, is_in_shopping_cart и подписки.
+
+    Версия берется из общего кэша, а не из request.user: пользователь
+    из кэша токенов может быть устаревшим.
+    """
+
+    user = request.user
+    if not user.is_authenticated:
+        return ('anonymous', None)
+    return (user.id, get_lists_version(user.id))
+
+
+def make_etag(*parts):
+    return '"{}"'.format(
+        hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def conditional(get_state):
+    """ETag и Last-Modified; 304 отдается до выборки и сериализации.
+
+    get_state(view, request, *args, **kwargs) возвращает кортеж
+    (etag, last_modified, use_last_modified) или None, если объекта нет.
+    При use_last_modified=False If-Modified-Since не проверяется:
+    для списков время изменения не отражает удаление рецептов.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            state = get_state(self, request, *args, **kwargs)
+            if state is None:
+                return method(self, request, *args, **kwargs)
+            etag, last_modified, use_last_modified = state
+            timestamp = (
+                int(last_modified.timestamp()) if last_modified else None)
+            response = get_conditional_response(
+                request,
+                etag=etag,
+                last_modified=timestamp if use_last_modified else None)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (HTTP_200_OK, HTTP_304_NOT_MODIFIED):
+                response['ETag'] = etag
+                if timestamp is not None:
+                    response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,146 @@
+import binascii
+import uuid
+from base64 import b64decode
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from PIL import Image, UnidentifiedImageError
+from rest_framework.fields import ImageField, SkipField
+from rest_framework.relations import (MANY_RELATION_KWARGS, ManyRelatedField,
+                                      PrimaryKeyRelatedField)
+
+
+class BulkManyRelatedField(ManyRelatedField):
+    """Проверяет весь список первичных ключей одним запросом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        pks = []
+        for pk in data:
+            try:
+                pks.append(int(pk))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        objects = child.get_queryset().in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class StreamingBase64ImageField(ImageField):
+    """Картинка в base64 (data URI), декодируемая по частям.
+
+    Строка декодируется кусками прямо в файл загрузки: до
+    FILE_UPLOAD_MAX_MEMORY_SIZE в памяти, больше - во временный файл на
+    диске, как обычная multipart-загрузка. Размеры картинки проверяются
+    по заголовку, до декодирования остальных данных. Переносы строк
+    (base64 по 76 символов) пропускаются внутри каждого куска.
+    """
+
+    # Кратно 4, чтобы каждый кусок декодировался независимо.
+    CHUNK_SIZE = 64 * 1024
+    HEADER_LIMIT = 256 * 1024
+    WHITESPACE = ' \t\r\n'
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректная картинка в base64.',
+        'max_size': 'Картинка больше {max_size} байт.',
+        'max_pixels': 'Картинка больше {max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            raise SkipField()
+        if isinstance(data, str) and data.startswith('data:'):
+            data = self.decode(data)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        # Срезы вместо split: строка может весить десятки мегабайт.
+        offset = data.find(',') + 1
+        header = data[:offset - 1]
+        if not offset or not header.endswith(';base64') or offset == len(data):
+            self.fail('invalid_base64')
+        content_type = header[len('data:'):-len(';base64')]
+        # count по каждому символу быстрее регулярного выражения.
+        spaces = sum(data.count(char, offset) for char in self.WHITESPACE)
+        size = (
+            (len(data) - offset - spaces) // 4 * 3
+            - data[-4:].rstrip()[-2:].count('='))
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+        name = f'{uuid.uuid4()}.{content_type.split("/")[-1]}'
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile(name, content_type, size, None)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, name, content_type, size, None)
+        head = b''
+        try:
+            for chunk in self.iter_chunks(data, offset, spaces):
+                if head is not None and len(head) < self.HEADER_LIMIT:
+                    head += chunk
+                    if self.check_header(head):
+                        head = None
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        except Exception:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
+    def iter_chunks(self, data, offset, spaces):
+        """Декодирует строку по кускам, пропуская пробелы и переносы."""
+
+        pending = ''
+        for start in range(offset, len(data), self.CHUNK_SIZE):
+            part = data[start:start + self.CHUNK_SIZE]
+            if spaces:
+                # Без пробелов кусок может стать не кратен 4:
+                # остаток переходит в следующий.
+                part = pending + ''.join(part.split())
+                end = len(part) // 4 * 4
+                part, pending = part[:end], part[end:]
+            yield b64decode(part, validate=True)
+        if pending:
+            raise ValueError('Длина base64 не кратна 4.')
+
+    def check_header(self, head):
+        """Проверяет размеры по началу файла, если заголовок уже прочитан."""
+
+        try:
+            # Image.open ленивый: читает только заголовок, без пикселей.
+            with Image.open(BytesIO(head)) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            # Pillow сам отказывается открывать слишком большие картинки.
+            self.fail('max_pixels', max_pixels=min(
+                settings.RECIPE_IMAGE_MAX_PIXELS,
+                2 * Image.MAX_IMAGE_PIXELS))
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            return False
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail(
+                'max_pixels', max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        return True
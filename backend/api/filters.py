@@ -1,8 +1,30 @@
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
 import django_filters as filters
 
+from api.cache import get_version
 from users.models import User
-from recipes.models import Recipe
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
+
+TAG_IDS_KEY = 'api:tag-ids:{}'
+TAG_IDS_TIMEOUT = 5 * 60
+
+
+def get_tag_ids(slugs):
+    """id тэгов по слагам из закэшированной карты slug -> id.
+
+    Ключ карты версионируется вместе с кэшем тэгов и меняется при любом
+    изменении тэга. Неизвестные слаги пропускаются.
+    """
+
+    key = TAG_IDS_KEY.format(get_version('tags'))
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, TAG_IDS_TIMEOUT)
+    return [tag_ids[slug] for slug in slugs if slug in tag_ids]
 
 
 class TagsMultipleChoiceField(
@@ -20,23 +42,94 @@ class TagsMultipleChoiceField(
                     params={'value': val},)
 
 
-class TagsFilter(filters.AllValuesMultipleFilter):
+class TagsFilter(filters.MultipleChoiceFilter):
+    """Рецепты хотя бы с одним из тэгов, без JOIN и DISTINCT.
+
+    Слаги переводятся в id по карте из кэша, а отбор - подзапрос EXISTS
+    по индексу (recipe_id, tag_id) таблицы связи. Список выбора не
+    нужен, поэтому запроса SELECT DISTINCT slug на каждый запрос нет.
+    Неизвестные слаги не совпадают ни с одним рецептом: если известных
+    нет совсем, выборка пуста, как и раньше с tags__slug__in.
+    """
+
     field_class = TagsMultipleChoiceField
 
+    def filter(self, queryset, value):
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids(value)
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=tag_ids)))
+
 
 class RecipeFilter(filters.FilterSet):
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all())
     is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_is_in_shopping_cart',
         widget=filters.widgets.BooleanWidget(),
         label='В корзине.')
     is_favorited = filters.BooleanFilter(
+        method='filter_is_favorited',
         widget=filters.widgets.BooleanWidget(),
         label='В избранных.')
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = TagsFilter(
         label='Ссылка')
+    search = filters.CharFilter(
+        method='filter_search',
+        label='Поиск')
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'is_in_shopping_cart', 'author', 'tags']
+        fields = [
+            'is_favorited', 'is_in_shopping_cart', 'author', 'tags', 'search']
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, ингредиентам и описанию."""
+
+        return search_recipes(queryset, value)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_membership(queryset, 'favorite_recipe', name, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_membership(queryset, 'shopping_cart', name, value)
+
+    def filter_membership(self, queryset, relation, name, value):
+        """Свои рецепты в избранном/корзине - от последних добавленных.
+
+        JOIN по уникальному (user, recipe) не плодит дублей, а порядок
+        берется из индекса (user, created, id) таблицы связи.
+        """
+
+        if not value:
+            return queryset.filter(**{name: False})
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(**{f'{relation}__user': user}).order_by(
+            f'-{relation}__created', f'-{relation}__id')
+
+
+class IngredientFilter(filters.FilterSet):
+    name = filters.CharFilter(
+        method='filter_name',
+        label='Название')
+
+    class Meta:
+        model = Ingredient
+        fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        """Совпадения по началу названия выше совпадений по подстроке."""
+
+        return queryset.filter(
+            name__icontains=value
+        ).annotate(
+            is_substring=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField())
+        ).order_by('is_substring', 'name')
@@ -0,0 +1,219 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Накопительная гистограмма в формате Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def expose(self, name, labels):
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append(
+                f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class ViewStats:
+
+    def __init__(self, window):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.render_time = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.recent = deque(maxlen=window)
+
+    def observe(self, sample):
+        self.latency.observe(sample.total)
+        self.db_time.observe(sample.db_time)
+        self.render_time.observe(sample.render_time)
+        self.queries.observe(sample.queries)
+        self.recent.append(sample.total)
+
+    def quantile(self, q):
+        recent = sorted(self.recent)
+        return recent[min(int(q * len(recent)), len(recent) - 1)]
+
+
+class MetricsRegistry:
+    """Метрики по вьюхам в памяти процесса.
+
+    У каждого воркера gunicorn свой реестр, сводить их должен Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(
+            lambda: ViewStats(settings.METRICS_WINDOW))
+
+    def observe(self, sample):
+        with self._lock:
+            self._views[(sample.view, sample.method)].observe(sample)
+
+    def expose(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+
+        metrics = {
+            'foodgram_request_seconds': (
+                'histogram', 'Время обработки запроса.', 'latency'),
+            'foodgram_db_seconds': (
+                'histogram', 'Время SQL-запросов за запрос.', 'db_time'),
+            'foodgram_render_seconds': (
+                'histogram',
+                'Время рендеринга ответа (JSON, файлы, потоковое тело); '
+                'сериализаторы DRF работают раньше, во вьюхе.',
+                'render_time'),
+            'foodgram_db_queries': (
+                'histogram', 'Число SQL-запросов за запрос.', 'queries'),
+        }
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+            for name, (kind, help_text, attr) in metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for (view, method), stats in views:
+                    lines.extend(getattr(stats, attr).expose(
+                        name, f'view="{view}",method="{method}"'))
+            name = 'foodgram_recent_request_seconds'
+            lines.append(
+                f'# HELP {name} Квантили по последним '
+                f'{settings.METRICS_WINDOW} запросам.')
+            lines.append(f'# TYPE {name} gauge')
+            for (view, method), stats in views:
+                for q in QUANTILES:
+                    lines.append(
+                        f'{name}{{view="{view}",method="{method}",'
+                        f'quantile="{q}"}} {stats.quantile(q)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class Sample:
+    """Замеры одного запроса."""
+
+    def __init__(self, method):
+        self.view = 'unknown'
+        self.method = method
+        self.started = time.perf_counter()
+        self.rendering_started = None
+        self.queries = 0
+        self.db_time = 0
+        self.render_time = 0
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка для connection.execute_wrapper."""
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def finish(self):
+        now = time.perf_counter()
+        self.total = now - self.started
+        if self.rendering_started is not None:
+            self.render_time = now - self.rendering_started
+
+
+class MetricsMiddleware:
+    """Число запросов к базе, время в базе, рендер и общее время по вьюхам.
+
+    Часть запросов (METRICS_PROFILE_SAMPLE_RATE) выполняется под cProfile,
+    и если запрос дольше METRICS_SLOW_REQUEST_SECONDS, профиль
+    сохраняется в METRICS_PROFILE_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample = request.metrics = Sample(request.method)
+        profiler = None
+        if random.random() < settings.METRICS_PROFILE_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+        with self.measure(sample, profiler):
+            response = self.get_response(request)
+        if request.resolver_match is not None:
+            sample.view = request.resolver_match.view_name
+        if response.streaming:
+            # Потоковый ответ (список покупок) выбирает данные и
+            # рендерится, когда сервер читает тело, - уже после return.
+            response.streaming_content = self.stream(
+                response.streaming_content, sample, profiler)
+        else:
+            self.record(sample, profiler)
+        return response
+
+    @contextmanager
+    def measure(self, sample, profiler):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sample))
+            if profiler is not None:
+                profiler.enable()
+                stack.callback(profiler.disable)
+            yield
+
+    def stream(self, content, sample, profiler):
+        if sample.rendering_started is None:
+            sample.rendering_started = time.perf_counter()
+        try:
+            with self.measure(sample, profiler):
+                yield from content
+        finally:
+            self.record(sample, profiler)
+
+    def record(self, sample, profiler):
+        sample.finish()
+        registry.observe(sample)
+        if (
+            profiler is not None
+            and sample.total >= settings.METRICS_SLOW_REQUEST_SECONDS
+        ):
+            self.dump_profile(profiler, sample)
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся сразу после этого хука.
+        request.metrics.rendering_started = time.perf_counter()
+        return response
+
+    def dump_profile(self, profiler, sample):
+        os.makedirs(settings.METRICS_PROFILE_DIR, exist_ok=True)
+        view = sample.view.replace(':', '_')
+        profiler.dump_stats(os.path.join(
+            settings.METRICS_PROFILE_DIR,
+            f'{int(time.time())}-{view}-{sample.total:.3f}s.prof'))
@@ -1,6 +1,25 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Лента рецептов по курсору: без COUNT(*) и OFFSET на глубоких страницах.
+
+    Включается параметром ?cursor= (для первой страницы - пустым).
+    """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionCursorPagination(RecipeCursorPagination):
+    ordering = '-id'
+
+
+class FeedCursorPagination(RecipeCursorPagination):
+    """Лента подписок всегда по курсору, по индексу записей ленты."""
@@ -0,0 +1,32 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    """Базовый рендерер текстовых ответов.
+
+    Список покупок отдается потоком в обход рендерера, для него здесь
+    рендерятся только ответы с ошибками (401, 404 и т.п.).
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return '\n'.join(
+                f'{key}: {value}' for key, value in data.items())
+        return str(data)
+
+
+class TxtRenderer(PlainTextRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CsvRenderer(PlainTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PdfRenderer(PlainTextRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
@@ -0,0 +1,112 @@
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'pin_primary'
+PIN_SALT = 'api.replicas'
+PIN_KEY = 'api:replicas:pin:{}'
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+@contextmanager
+def read_from_primary():
+    """Чтение с основной базы внутри безопасного запроса, который пишет."""
+
+    token = _read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+class ReplicaRouter:
+    """Чтение в безопасных запросах - с реплики, все остальное - с основной.
+
+    Без настроенной реплики (DB_REPLICA_HOST) роутер ничего не меняет.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (
+            _read_from_replica.get()
+            and REPLICA_DB in settings.DATABASES
+            # Внутри транзакции читаем то, что только что записали.
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_DB
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Помечает GET/HEAD/OPTIONS как запросы, читающие с реплики.
+
+    После любого изменяющего запроса клиент на DB_REPLICA_PIN_SECONDS
+    закрепляется за основной базой, чтобы увидеть свои изменения
+    (is_favorited, is_in_shopping_cart и т.п.) несмотря на отставание
+    реплики. Закрепление хранится в подписанной cookie - ее шлет SPA,
+    в том числе сразу после входа, - и в кэше по заголовку Authorization
+    для клиентов без cookie.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if REPLICA_DB not in settings.DATABASES:
+            return self.get_response(request)
+        token = _read_from_replica.set(
+            request.method in SAFE_METHODS and not self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_from_replica.reset(token)
+        if request.method not in SAFE_METHODS:
+            self.pin(request, response)
+        return response
+
+    @staticmethod
+    def get_pin_key(request):
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if not authorization:
+            return None
+        return PIN_KEY.format(
+            hashlib.md5(authorization.encode()).hexdigest())
+
+    def is_pinned(self, request):
+        if request.get_signed_cookie(
+            PIN_COOKIE,
+            default=None,
+            salt=PIN_SALT,
+            max_age=settings.DB_REPLICA_PIN_SECONDS,
+        ):
+            return True
+        key = self.get_pin_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def pin(self, request, response):
+        response.set_signed_cookie(
+            PIN_COOKIE,
+            '1',
+            salt=PIN_SALT,
+            max_age=settings.DB_REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite='Lax')
+        key = self.get_pin_key(request)
+        if key is not None:
+            cache.set(key, 1, settings.DB_REPLICA_PIN_SECONDS)
@@ -1,20 +1,31 @@
 import django.contrib.auth.password_validation as validators
 from django.contrib.auth import get_user_model
-from drf_base64.fields import Base64ImageField
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework.serializers import (
-    ModelSerializer, SerializerMethodField, BooleanField,
-    PrimaryKeyRelatedField, IntegerField, CharField, EmailField,
+    ModelSerializer, Serializer, SerializerMethodField, BooleanField,
+    IntegerField, CharField, EmailField, ListField,
     ValidationError, CurrentUserDefault, ReadOnlyField)
 
-from recipes.models import Ingredient, Recipe, Tag, RecipeIngredient, Subscribe
+from api.fields import BulkPrimaryKeyRelatedField, StreamingBase64ImageField
+from api.subscriptions import get_recipes_limit
+from recipes.models import (Ingredient, Recipe, Tag, RecipeIngredient,
+                            ShoppingCartItem, Subscribe)
+from recipes.shopping_cart import rebuild_for_recipe
 
 User = get_user_model()
 ERR_MSG = 'Не удается войти в систему с предоставленными учетными данными.'
+BATCH_LIMIT = 100
 
 
 class GetIsSubscribedMixin:
 
     def get_is_subscribed(self, obj):
+        # Во вьюсетах подписка уже посчитана аннотацией Exists.
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         user = self.context['request'].user
         return (
             user.follower.filter(author=obj).exists()
@@ -65,6 +76,36 @@ class IngredientSerializer(ModelSerializer):
         read_only_fields = ("__all__",)
 
 
+class RecipeImageMixin:
+    """Ссылки на картинку рецепта, ее миниатюру и WebP-варианты.
+
+    Если в контексте thumbnails=True, в image отдается миниатюра.
+    """
+
+    def build_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image(self, obj):
+        if not obj.image:
+            return None
+        thumb = obj.image_variants.get('thumb')
+        if thumb and self.context.get('thumbnails'):
+            return self.build_url(thumb)
+        return self.build_url(obj.image.name)
+
+    def get_image_thumb(self, obj):
+        thumb = obj.image_variants.get('thumb')
+        return self.build_url(thumb) if thumb else None
+
+    def get_image_srcset(self, obj):
+        webp = obj.image_variants.get('webp', {})
+        return ', '.join(
+            f'{self.build_url(webp[width])} {width}w'
+            for width in sorted(webp, key=int)) or None
+
+
 class RecipeIngredientSerializer(ModelSerializer):
     id = ReadOnlyField(
         source='ingredient.id')
@@ -79,6 +120,31 @@ class RecipeIngredientSerializer(ModelSerializer):
             'id', 'name', 'measurement_unit', 'amount')
 
 
+class BatchSerializer(Serializer):
+    """id рецептов или авторов для изменения пачкой."""
+
+    ids = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_LIMIT)
+
+
+class ShoppingCartItemSerializer(ModelSerializer):
+    id = ReadOnlyField(
+        source='ingredient_id')
+    name = ReadOnlyField(
+        source='ingredient.name')
+    measurement_unit = ReadOnlyField(
+        source='ingredient.measurement_unit')
+    amount = ReadOnlyField(
+        source='total_amount')
+
+    class Meta:
+        model = ShoppingCartItem
+        fields = (
+            'id', 'name', 'measurement_unit', 'amount')
+
+
 class RecipeUserSerializer(
         GetIsSubscribedMixin,
         ModelSerializer):
@@ -104,10 +170,10 @@ class IngredientsEditSerializer(ModelSerializer):
 
 
 class RecipeWriteSerializer(ModelSerializer):
-    image = Base64ImageField(
+    image = StreamingBase64ImageField(
         max_length=None,
         use_url=True)
-    tags = PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all())
     ingredients = IngredientsEditSerializer(
@@ -115,15 +181,14 @@ class RecipeWriteSerializer(ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('author',)
 
-    def validate_tags(self, data):
-        tags = data['tags']
+    def validate_tags(self, tags):
         if not tags:
             raise ValidationError(
                 'Нужен хотя бы один тэг для рецепта!')
-        return data
+        return tags
 
     def validate_cooking_time(self, cooking_time):
         if int(cooking_time) < 1:
@@ -139,15 +204,60 @@ class RecipeWriteSerializer(ModelSerializer):
             if int(ingredient.get('amount')) < 1:
                 raise ValidationError(
                     'Количество ингредиента >= 1!')
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise ValidationError(
+                'Ингредиенты в рецепте не должны повторяться!')
+        existing = set(Ingredient.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+        missing = [
+            ingredient_id for ingredient_id in ids
+            if ingredient_id not in existing]
+        if missing:
+            raise ValidationError(
+                f'Ингредиенты с id {missing} не найдены!')
         return ingredients
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount'), )
-
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount'])
+            for ingredient in ingredients)
+
+    def update_ingredients(self, ingredients, recipe):
+        """Трогаем только добавленные, удаленные и измененные строки.
+
+        Возвращает True, если состав рецепта изменился.
+        """
+
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients}
+        current = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)}
+        removed = [
+            item.id for ingredient_id, item in current.items()
+            if ingredient_id not in amounts]
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in current]
+        self.create_ingredients(added, recipe)
+        return bool(removed or changed or added)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -156,11 +266,12 @@ class RecipeWriteSerializer(ModelSerializer):
         self.create_ingredients(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
+        if 'ingredients' in validated_data and self.update_ingredients(
+                validated_data.pop('ingredients'), instance):
+            # Суммы в списках покупок считались по старому составу.
+            rebuild_for_recipe(instance.id)
         if 'tags' in validated_data:
             instance.tags.set(
                 validated_data.pop('tags'))
@@ -168,6 +279,13 @@ class RecipeWriteSerializer(ModelSerializer):
             instance, validated_data)
 
     def to_representation(self, instance):
+        # После update() DRF сбрасывает кэш prefetch: без него ингредиенты
+        # выбирались бы по одному.
+        prefetch_related_objects(
+            [instance], 'tags', Prefetch(
+                'recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')))
         return RecipeReadSerializer(
             instance,
             context={
@@ -175,8 +293,12 @@ class RecipeWriteSerializer(ModelSerializer):
             }).data
 
 
-class RecipeReadSerializer(ModelSerializer):
-    image = Base64ImageField()
+class RecipeReadSerializer(
+        RecipeImageMixin,
+        ModelSerializer):
+    image = SerializerMethodField()
+    image_thumb = SerializerMethodField()
+    image_srcset = SerializerMethodField()
     tags = TagSerializer(
         many=True,
         read_only=True)
@@ -194,10 +316,15 @@ class RecipeReadSerializer(ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = (
+            'favorites_count', 'in_carts_count', 'image_variants',
+            'search_vector')
 
 
-class SubscribeRecipeSerializer(ModelSerializer):
+class SubscribeRecipeSerializer(
+        RecipeImageMixin,
+        ModelSerializer):
+    image = SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -216,9 +343,12 @@ class SubscribeSerializer(ModelSerializer):
     last_name = CharField(
         source='author.last_name')
     recipes = SerializerMethodField()
+    # Строка подписки сама по себе означает, что подписка есть.
     is_subscribed = BooleanField(
-        read_only=True)
+        read_only=True,
+        default=True)
     recipes_count = IntegerField(
+        source='author.recipes_count',
         read_only=True)
 
     class Meta:
@@ -229,10 +359,13 @@ class SubscribeSerializer(ModelSerializer):
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = (
-            obj.author.recipe.all()[:int(limit)] if limit
-            else obj.author.recipe.all())
+        # В списке подписок рецепты всех авторов страницы загружены заранее.
+        if 'author_recipes' in self.context:
+            recipes = self.context['author_recipes'].get(obj.author_id, [])
+        else:
+            limit = get_recipes_limit(request)
+            recipes = obj.author.recipe.all()[:limit]
         return SubscribeRecipeSerializer(
             recipes,
-            many=True).data
+            many=True,
+            context={'request': request, 'thumbnails': True}).data
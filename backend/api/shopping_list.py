@@ -0,0 +1,113 @@
+import csv
+import os
+from functools import lru_cache
+from itertools import chain
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+from recipes.models import ShoppingCartItem
+
+TITLE = 'Список покупок:'
+EMPTY_MSG = 'Список покупок пуст!'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+CHUNK_SIZE = 500
+PDF_FONT = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 20 * mm
+PDF_LINE_HEIGHT = 7 * mm
+PDF_MAX_MEMORY = 1024 * 1024
+
+
+def get_shopping_list(user):
+    """Готовые суммы ингредиентов корзины, без агрегации по рецептам."""
+
+    return (
+        ShoppingCartItem.objects
+        .filter(user=user)
+        .values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            amount=F('total_amount'))
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+        .iterator(chunk_size=CHUNK_SIZE))
+
+
+def format_row(index, row):
+    return (
+        f'{index}. {row["ingredient__name"]} - '
+        f'{row["amount"]} '
+        f'{row["ingredient__measurement_unit"]}.')
+
+
+def iter_lines(rows):
+    """Строки списка покупок с заголовком."""
+
+    first = next(rows, None)
+    if first is None:
+        yield EMPTY_MSG
+        return
+    yield TITLE
+    yield ''
+    for index, row in enumerate(chain((first,), rows), start=1):
+        yield format_row(index, row)
+
+
+def stream_txt(rows):
+    for line in iter_lines(rows):
+        yield f'{line}\n'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel открывал кириллицу без танцев с кодировкой.
+    yield '\ufeff' + writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['amount'],
+            row['ingredient__measurement_unit']))
+
+
+@lru_cache(maxsize=None)
+def get_pdf_font():
+    """Регистрирует TTF-шрифт с кириллицей, если он есть в системе."""
+
+    font_path = settings.SHOPPING_LIST_FONT
+    if font_path and os.path.exists(font_path):
+        pdfmetrics.registerFont(TTFont(PDF_FONT, font_path))
+        return PDF_FONT
+    return 'Helvetica'
+
+
+def build_pdf(rows):
+    """Собирает pdf во временный файл, который затем отдается частями."""
+
+    file = SpooledTemporaryFile(max_size=PDF_MAX_MEMORY)
+    canvas = Canvas(file, pagesize=A4)
+    font = get_pdf_font()
+    _, height = A4
+    y = height - PDF_MARGIN
+    canvas.setFont(font, PDF_FONT_SIZE)
+    for line in iter_lines(rows):
+        if y < PDF_MARGIN:
+            canvas.showPage()
+            canvas.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        canvas.drawString(PDF_MARGIN, y, line)
+        y -= PDF_LINE_HEIGHT
+    canvas.save()
+    file.seek(0)
+    return file
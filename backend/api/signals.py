@@ -0,0 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.cache import bump_version
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes(**kwargs):
+    bump_version('recipes')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_version('tags')
+    bump_version('recipes')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_version('ingredients')
+    bump_version('recipes')
+
+
+@receiver(post_save, sender=User)
+def invalidate_authors(instance, created, update_fields=None, **kwargs):
+    # Вход, смена пароля и счетчики в карточку рецепта не входят,
+    # а удаление автора удаляет и рецепты - это сбросит версию само.
+    if not created and instance.author_fields_changed(update_fields):
+        bump_version('recipes')
+
+
+def invalidate_user_tokens(user_id):
+    token_cache.invalidate(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    """Выход (djoser token/logout) удаляет токен - и запись в кэше."""
+
+    token_cache.invalidate([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(instance, **kwargs):
+    # Деактивация, смена пароля или прав, правка профиля.
+    invalidate_user_tokens(instance.pk)
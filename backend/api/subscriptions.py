@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from recipes.models import Recipe
+
+RECIPE_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+def get_recipes_limit(request):
+    """recipes_limit из запроса; некорректное значение игнорируется."""
+
+    try:
+        limit = int(request.query_params.get('recipes_limit', ''))
+    except ValueError:
+        return None
+    return limit if limit > 0 else None
+
+
+def get_author_recipes(author_ids, limit=None):
+    """Последние рецепты авторов одним запросом: {author_id: [recipe]}.
+
+    С limit в каждой группе авторов остается не больше limit рецептов:
+    ROW_NUMBER() OVER (PARTITION BY author_id) во вложенном запросе.
+    """
+
+    recipes = defaultdict(list)
+    if not author_ids:
+        # Пустой IN в сыром SQL не собрать, да и запрос не нужен.
+        return recipes
+    ordering = (F('pub_date').desc(), F('id').desc())
+    queryset = (
+        Recipe.objects
+        .filter(author_id__in=author_ids)
+        .only(*RECIPE_FIELDS, 'pub_date')
+        .order_by('author_id', *ordering))
+    if limit is not None:
+        queryset = queryset.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=ordering))
+        # Django 4.1 не умеет фильтровать по оконной функции.
+        sql, params = queryset.query.sql_with_params()
+        queryset = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY author_id, pub_date DESC, id DESC',
+            (*params, limit))
+    for recipe in queryset:
+        recipes[recipe.author_id].append(recipe)
+    return recipes
@@ -0,0 +1,423 @@
+import time
+from base64 import b64encode, encodebytes
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from api.authentication import token_cache
+from api.fields import StreamingBase64ImageField
+from api.replicas import PIN_COOKIE, REPLICA_DB
+
+from recipes.factories import (create_ingredients, create_recipe,
+                               create_tags, create_user, make_png)
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart, Subscribe
+
+RECIPES_URL = '/api/recipes/'
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Страница рецептов - одно и то же число запросов при любом размере."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        authors = [create_user(f'author{number}') for number in range(3)]
+        tags = create_tags(3)
+        ingredients = create_ingredients(5)
+        for number in range(12):
+            recipe = create_recipe(
+                authors[number % len(authors)], f'Рецепт {number}',
+                ingredients[:number % 4 + 2], tags=tags[:number % 3 + 1])
+            if number % 2:
+                FavoriteRecipe.objects.create(user=cls.user, recipe=recipe)
+            if number % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Subscribe.objects.create(user=cls.user, author=authors[0])
+
+    def assert_page_queries(self, queries, params=None):
+        for limit in (2, 10):
+            # Анонимные ответы кэшируются - каждый замер с пустым кэшем.
+            cache.clear()
+            with self.subTest(limit=limit), self.assertNumQueries(queries):
+                response = self.client.get(
+                    RECIPES_URL, {'limit': limit, **(params or {})})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        # COUNT, страница, тэги, авторы, ингредиенты.
+        self.assert_page_queries(5)
+
+    def test_authenticated(self):
+        # Аннотации пользователя входят в запрос страницы и авторов.
+        self.client.force_authenticate(self.user)
+        self.assert_page_queries(5)
+
+    def test_token(self):
+        # Токен ищется в базе только при первом запросе, дальше - из кэша.
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        with self.assertNumQueries(6):
+            self.client.get(RECIPES_URL, {'limit': 2})
+        self.assert_page_queries(5)
+
+    def test_cursor(self):
+        # Без COUNT.
+        self.client.force_authenticate(self.user)
+        self.assert_page_queries(4, {'cursor': ''})
+
+    def test_flags(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(RECIPES_URL, {'limit': 12})
+        recipes = {recipe['id']: recipe for recipe in response.data['results']}
+        for recipe in Recipe.objects.all():
+            data = recipes[recipe.id]
+            self.assertEqual(
+                data['is_favorited'],
+                FavoriteRecipe.objects.filter(
+                    user=self.user, recipe=recipe).exists())
+            self.assertEqual(
+                data['is_in_shopping_cart'],
+                ShoppingCart.objects.filter(
+                    user=self.user, recipe=recipe).exists())
+            self.assertEqual(
+                data['author']['is_subscribed'],
+                recipe.author.username == 'author0')
+            self.assertEqual(
+                len(data['ingredients']), recipe.ingredients.count())
+
+
+class SubscriptionsQueriesTest(APITestCase):
+    """Подписки: 3 запроса при любом размере страницы и recipes_limit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        for number in range(6):
+            author = create_user(f'author{number}')
+            for recipe in range(number + 1):
+                create_recipe(author, f'Рецепт {recipe}')
+            Subscribe.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_queries(self):
+        # COUNT, страница подписок с авторами, рецепты всех авторов.
+        for limit in (2, 5):
+            for recipes_limit in (None, 1, 3):
+                params = {'limit': limit}
+                if recipes_limit is not None:
+                    params['recipes_limit'] = recipes_limit
+                with self.subTest(**params), self.assertNumQueries(3):
+                    response = self.client.get(
+                        '/api/users/subscriptions/', params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+                for author in response.data['results']:
+                    count = Recipe.objects.filter(author=author['id']).count()
+                    self.assertTrue(author['is_subscribed'])
+                    self.assertEqual(author['recipes_count'], count)
+                    self.assertEqual(
+                        len(author['recipes']),
+                        min(count, recipes_limit or count))
+
+
+class BatchTest(APITestCase):
+    """Пачки: счетчики и списки покупок меняются ровно один раз."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        ingredients = create_ingredients(1)
+        cls.recipes = [
+            create_recipe(cls.user, f'Рецепт {number}', ingredients)
+            for number in range(3)]
+        # У другого пользователя те же рецепты: счетчики начинаются с 1.
+        other = create_user('other')
+        for recipe in cls.recipes:
+            FavoriteRecipe.objects.create(user=other, recipe=recipe)
+            ShoppingCart.objects.create(user=other, recipe=recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_favorite_and_cart(self):
+        ids = [recipe.id for recipe in self.recipes]
+        for url, counter in (
+            ('/api/recipes/favorite/', 'favorites_count'),
+            ('/api/recipes/shopping_cart/', 'in_carts_count'),
+        ):
+            self.client.post(url, {'ids': ids}, format='json')
+            response = self.client.delete(
+                url, {'ids': ids[:2]}, format='json')
+            self.assertEqual(
+                [item['status'] for item in response.data['results']],
+                ['deleted', 'deleted'])
+            self.assertEqual(
+                list(Recipe.objects.order_by('id').values_list(
+                    counter, flat=True)),
+                [1, 1, 2])
+        self.assertEqual(
+            list(self.user.shopping_cart_items.values_list(
+                'total_amount', flat=True)),
+            [100])
+
+
+class RecipeWriteTest(APITestCase):
+    """Правка рецепта: меняются только затронутые строки ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.tags = create_tags(2)
+        cls.ingredients = create_ingredients(4)
+        cls.recipe = create_recipe(
+            cls.user, ingredients=cls.ingredients[:3], tags=cls.tags[:1])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = f'{RECIPES_URL}{self.recipe.id}/'
+
+    def get_rows(self):
+        return dict(self.recipe.recipe.values_list(
+            'ingredient_id', 'id'))
+
+    def patch(self, **data):
+        return self.client.patch(self.url, data, format='json')
+
+    def test_ingredient_diff(self):
+        first, second, third, fourth = self.ingredients
+        before = self.get_rows()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(ingredients=[
+                {'id': first.id, 'amount': 100},
+                {'id': second.id, 'amount': 200},
+                {'id': fourth.id, 'amount': 50}])
+        self.assertEqual(response.status_code, 200)
+        after = self.get_rows()
+        self.assertEqual(set(after), {first.id, second.id, fourth.id})
+        self.assertEqual(after[first.id], before[first.id])
+        self.assertEqual(after[second.id], before[second.id])
+        self.assertNotIn(third.id, after)
+        self.assertEqual(
+            dict(self.recipe.recipe.values_list('ingredient_id', 'amount')),
+            {first.id: 100, second.id: 200, fourth.id: 50})
+        # Строка с прежним количеством не переписывается.
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "recipes_recipeingredient"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn(f'"id" = {before[first.id]})', updates[0])
+
+    def test_update_queries(self):
+        ingredients = [
+            {'id': ingredient.id, 'amount': 100 + number}
+            for number, ingredient in enumerate(self.ingredients)]
+        # Рецепт с флагами и prefetch, проверка ингредиентов, SAVEPOINT,
+        # строки рецепта, UPDATE, INSERT, корзины с рецептом, UPDATE
+        # рецепта, RELEASE, тэги и ингредиенты для ответа.
+        with self.assertNumQueries(14):
+            response = self.patch(ingredients=ingredients)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid(self):
+        ingredient = self.ingredients[0]
+        for data in (
+            {'ingredients': [
+                {'id': ingredient.id, 'amount': 1},
+                {'id': ingredient.id, 'amount': 2}]},
+            {'ingredients': [{'id': 999999, 'amount': 1}]},
+            {'tags': []},
+            {'tags': [999999]},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.patch(**data).status_code, 400)
+        self.assertEqual(len(self.get_rows()), 3)
+
+
+
+class ConditionalTest(APITestCase):
+    """ETag списка и рецепта: 304 без выборки, новый ETag после записи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.recipe = create_recipe(cls.user)
+        cls.urls = (RECIPES_URL, f'{RECIPES_URL}{cls.recipe.id}/')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified(self):
+        # Список сверяется по версии в кэше, рецепт - по updated_at.
+        for url, queries in zip(self.urls, (0, 1)):
+            etag = self.client.get(url)['ETag']
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_write(self):
+        detail_url = self.urls[1]
+        for write in (
+            lambda: self.client.patch(
+                detail_url, {'name': 'Новое название'}, format='json'),
+            # Избранное меняет флаги пользователя, но не updated_at.
+            lambda: self.client.post(f'{detail_url}favorite/'),
+        ):
+            etags = [self.client.get(url)['ETag'] for url in self.urls]
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertIn(write().status_code, (200, 201))
+            for url, etag in zip(self.urls, etags):
+                with self.subTest(url=url):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertNotEqual(response['ETag'], etag)
+
+
+class StreamingBase64ImageFieldTest(SimpleTestCase):
+    """Картинка в base64: переносы строк, паддинг, размеры."""
+
+    def setUp(self):
+        self.png = make_png()
+        self.field = StreamingBase64ImageField()
+
+    def make_uri(self, encoded):
+        return f'data:image/png;base64,{encoded}'
+
+    def assert_fails(self, code, data):
+        with self.assertRaises(ValidationError) as error:
+            self.field.to_internal_value(data)
+        self.assertEqual(error.exception.detail[0].code, code)
+
+    def test_line_wrapped(self):
+        # Маленькие куски: переносы и остатки на границах кусков.
+        self.field.CHUNK_SIZE = 64
+        for wrapped in (
+            encodebytes(self.png).decode(),
+            encodebytes(self.png).decode().replace('\n', '\r\n'),
+        ):
+            with self.subTest(newline=repr(wrapped[76:78])):
+                file = self.field.to_internal_value(self.make_uri(wrapped))
+                file.seek(0)
+                self.assertEqual(file.read(), self.png)
+
+    def test_invalid_padding(self):
+        encoded = b64encode(self.png).decode()
+        for broken in (
+            encoded[:-1],
+            'ab=c' + encoded,
+            encoded + '=',
+        ):
+            with self.subTest(length=len(broken)):
+                self.assert_fails('invalid_base64', self.make_uri(broken))
+
+    def test_max_size(self):
+        uri = self.make_uri(b64encode(self.png).decode())
+        with override_settings(RECIPE_IMAGE_MAX_SIZE=len(self.png) - 1):
+            self.assert_fails('max_size', uri)
+
+    def test_max_pixels(self):
+        uri = self.make_uri(b64encode(self.png).decode())
+        with override_settings(RECIPE_IMAGE_MAX_PIXELS=800 * 600 - 1):
+            self.assert_fails('max_pixels', uri)
+        # Pillow сам останавливает картинки больше 2 * MAX_IMAGE_PIXELS.
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.assert_fails('max_pixels', uri)
+
+
+class ReplicaTest(APITransactionTestCase):
+    """Чтение с реплики и закрепление за основной базой после записи.
+
+    Реплика - второе подключение к той же тестовой базе: транзакционный
+    тест коммитит данные, и второе подключение их видит.
+    """
+
+    def setUp(self):
+        replica = patch.dict(settings.DATABASES, {
+            REPLICA_DB: {**connections[DEFAULT_DB_ALIAS].settings_dict}})
+        replica.start()
+        self.addCleanup(replica.stop)
+        self.addCleanup(self.drop_replica)
+        cache.clear()
+        self.user = create_user()
+        self.recipe = create_recipe(self.user)
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def drop_replica():
+        connections[REPLICA_DB].close()
+        del connections[REPLICA_DB]
+
+    def assert_reads_from_replica(self, expected):
+        with CaptureQueriesContext(connections[REPLICA_DB]) as replica:
+            response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(bool(replica.captured_queries), expected)
+
+    def favorite(self):
+        response = self.client.post(
+            f'{RECIPES_URL}{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_reads_to_primary(self):
+        self.assert_reads_from_replica(True)
+        self.favorite()
+        self.assert_reads_from_replica(False)
+
+    def test_tampered_cookie_is_ignored(self):
+        self.favorite()
+        # Значение с чужой подписью: '1:время:подпись' -> '2:время:подпись'.
+        value = self.client.cookies[PIN_COOKIE].value
+        self.client.cookies[PIN_COOKIE] = '2' + value[1:]
+        self.assert_reads_from_replica(True)
+
+    def test_expired_cookie_is_ignored(self):
+        self.favorite()
+        with override_settings(DB_REPLICA_PIN_SECONDS=0):
+            time.sleep(1)
+            self.assert_reads_from_replica(True)
+
+
+@override_settings(AUTH_TOKEN_SHARED_CACHE=True)
+class TokenCacheTest(APITestCase):
+    """Выход и удаление токена убирают его из LRU и общего кэша."""
+
+    def setUp(self):
+        cache.clear()
+        self.token = Token.objects.create(user=create_user())
+        # delete() обнуляет первичный ключ токена - это и есть key.
+        self.key = self.token.key
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        self.addCleanup(token_cache.invalidate, [self.key])
+
+    def assert_cached(self, cached):
+        self.assertEqual(self.key in token_cache._users, cached)
+        self.assertEqual(
+            cache.get(token_cache.get_key(self.key)) is not None, cached)
+
+    def check_revoked(self, revoke):
+        self.assertEqual(self.client.get(RECIPES_URL).status_code, 200)
+        self.assert_cached(True)
+        with self.captureOnCommitCallbacks(execute=True):
+            revoke()
+        self.assert_cached(False)
+        self.assertEqual(self.client.get(RECIPES_URL).status_code, 401)
+
+    def test_logout(self):
+        self.check_revoked(lambda: self.assertEqual(
+            self.client.post('/api/auth/token/logout/').status_code, 204))
+
+    def test_token_delete(self):
+        self.check_revoked(self.token.delete)
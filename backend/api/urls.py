@@ -1,16 +1,20 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (RecipesViewSet, UsersViewSet)
+from api.views import (IngredientsViewSet, MetricsView, RecipesViewSet,
+                       TagsViewSet, UsersViewSet)
 
 app_name = 'api'
 
 router = DefaultRouter()
 router.register('users', UsersViewSet)
 router.register('recipes', RecipesViewSet)
+router.register('tags', TagsViewSet)
+router.register('ingredients', IngredientsViewSet)
 
 
 urlpatterns = [
+    path('_metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
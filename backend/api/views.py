@@ -1,29 +1,84 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from django.db.models.aggregates import Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.db.models.expressions import Exists, OuterRef, Value
-from django.http.response import HttpResponse
+from django.http.response import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED
+from rest_framework.status import (HTTP_400_BAD_REQUEST, HTTP_201_CREATED,
+                                   HTTP_204_NO_CONTENT)
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action
 from rest_framework.permissions import (SAFE_METHODS, AllowAny,
-                                        IsAuthenticated,
+                                        IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
-from api.filters import RecipeFilter
-from recipes.models import (FavoriteRecipe, Recipe, ShoppingCart,
-                            Subscribe, Ingredient, Tag)
-from .serializers import (RecipeReadSerializer, RecipeWriteSerializer,
+from api.cache import cache_anonymous, get_version
+from api.conditional import conditional, get_user_state, make_etag
+from api.filters import IngredientFilter, RecipeFilter
+from api.metrics import registry
+from api.pagination import (FeedCursorPagination, RecipeCursorPagination,
+                            SubscriptionCursorPagination)
+from api.renderers import CsvRenderer, PdfRenderer, TxtRenderer
+from api.replicas import read_from_primary
+from api.shopping_list import (build_pdf, get_shopping_list, stream_csv,
+                               stream_txt)
+from api.subscriptions import (RECIPE_FIELDS, get_author_recipes,
+                               get_recipes_limit)
+from recipes.models import (FavoriteRecipe, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartItem, Subscribe,
+                            Ingredient, Tag, TimelineEntry)
+from recipes import batch
+from recipes.ingredient_index import ingredient_index
+from recipes.shopping_cart import lock_users
+from recipes.timeline import pull_popular, trim
+from .serializers import (BatchSerializer,
+                          RecipeReadSerializer, RecipeWriteSerializer,
+                          ShoppingCartItemSerializer,
                           SubscribeRecipeSerializer, SubscribeSerializer,
                           UserCreateSerializer, UserListSerializer,
                           IngredientSerializer, TagSerializer)
 
 
 User = get_user_model()
-FILENAME = 'shopping_list.txt'
+FILENAME = 'shopping_list'
+MUTATION_ACTIONS = (
+    'create_favorite', 'delete_favorite', 'create_crt', 'perform_crt')
+SHOPPING_LIST_STREAMS = {
+    'txt': stream_txt,
+    'csv': stream_csv,
+}
+
+
+def get_recipes_queryset(user):
+    """Рецепты с флагами для пользователя и всем нужным для выдачи."""
+
+    if user.is_authenticated:
+        is_favorited = Exists(FavoriteRecipe.objects.filter(
+            user=user, recipe=OuterRef('id')))
+        is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
+            user=user, recipe=OuterRef('id')))
+        is_subscribed = Exists(user.follower.filter(
+            author=OuterRef('id')))
+    else:
+        is_favorited = is_in_shopping_cart = is_subscribed = Value(False)
+    # Поисковый вектор в выдачу не входит, а весит как весь текст рецепта.
+    return Recipe.objects.defer('search_vector').annotate(
+        is_favorited=is_favorited,
+        is_in_shopping_cart=is_in_shopping_cart,
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'author',
+            queryset=User.objects.annotate(is_subscribed=is_subscribed)),
+        Prefetch(
+            'recipe',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient')))
 
 
 class GetObjectMixin:
@@ -39,15 +94,65 @@ class GetObjectMixin:
         return recipe
 
 
+def change_batch(request, model, queryset):
+    """POST добавляет, DELETE удаляет связи с объектами из списка ids.
+
+    Объекты проверяются одним запросом, изменения - одна транзакция.
+    В ответе статус по каждому id: created/exists, deleted/missing или
+    not_found.
+    """
+
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    pks = list(dict.fromkeys(serializer.validated_data['ids']))
+    found = set(queryset.filter(id__in=pks).values_list('id', flat=True))
+    valid = [pk for pk in pks if pk in found]
+    if request.method == 'POST':
+        done = batch.add(model, request.user, valid)
+        statuses = ('created', 'exists')
+    else:
+        done = batch.remove(model, request.user, valid)
+        statuses = ('deleted', 'missing')
+    done = set(done)
+    return Response({'results': [
+        {
+            'id': pk,
+            'status': (
+                'not_found' if pk not in found
+                else statuses[0] if pk in done
+                else statuses[1]),
+        }
+        for pk in pks]})
+
+
 class PermissionAndPaginationMixin:
     """Миксина для списка тегов и ингредиентов."""
 
+    permission_classes = (AllowAny,)
     pagination_class = None
 
 
-class UsersViewSet(UserViewSet):
+class CursorPaginationMixin:
+    """Миксина: с параметром ?cursor= пагинация по курсору, а не страницам."""
+
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if (
+            not hasattr(self, '_paginator')
+            and self.cursor_pagination_class is not None
+            and self.cursor_pagination_class.cursor_query_param
+            in self.request.query_params
+        ):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+
+class UsersViewSet(CursorPaginationMixin, UserViewSet):
     """Работа с пользователями."""
 
+    cursor_pagination_class = SubscriptionCursorPagination
     serializer_class = UserListSerializer
     permission_classes = (IsAuthenticated,)
 
@@ -71,7 +176,7 @@ class UsersViewSet(UserViewSet):
         serializer.save(password=password)
 
     def get_object(self):
-        user_id = self.kwargs['user_id']
+        user_id = self.kwargs[self.lookup_field]
         user = get_object_or_404(User, id=user_id)
         self.check_object_permissions(self.request, user)
         return user
@@ -81,23 +186,48 @@ class UsersViewSet(UserViewSet):
         """Подписка и отписка от пользователя."""
 
     @subscribe.mapping.post
-    def create(self, request, *args, **kwargs) -> Response:
+    def create_subscribe(self, request, *args, **kwargs) -> Response:
         instance = self.get_object()
         if request.user.id == instance.id:
             return Response(
                 {'errors': 'На самого себя нельзя подписаться!'},
                 status=HTTP_400_BAD_REQUEST)
-        if request.user.follower.filter(author=instance).exists():
-            return Response(
-                {'errors': 'Уже подписан!'},
-                status=HTTP_400_BAD_REQUEST)
-        subs = request.user.follower.create(author=instance)
-        serializer = self.get_serializer(subs)
+        with transaction.atomic():
+            # Как в recipes.batch: пачка и этот запрос не засчитают
+            # одну подписку дважды.
+            lock_users([request.user.id])
+            if request.user.follower.filter(author=instance).exists():
+                return Response(
+                    {'errors': 'Уже подписан!'},
+                    status=HTTP_400_BAD_REQUEST)
+            subs = request.user.follower.create(author=instance)
+        serializer = SubscribeSerializer(
+            subs, context={'request': request})
         return Response(serializer.data, status=HTTP_201_CREATED)
 
     @subscribe.mapping.delete
-    def delete_subscribe(self, instance) -> Response:
-        self.request.user.follower.filter(author=instance).delete()
+    def delete_subscribe(self, request, *args, **kwargs) -> Response:
+        instance = self.get_object()
+        with transaction.atomic():
+            lock_users([request.user.id])
+            deleted, _ = request.user.follower.filter(
+                author=instance).delete()
+        if not deleted:
+            return Response(
+                {'errors': 'Вы не подписаны на этого автора!'},
+                status=HTTP_400_BAD_REQUEST)
+        return Response(status=HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe',
+        permission_classes=(IsAuthenticated,))
+    def subscribe_batch(self, request):
+        """Подписка и отписка от нескольких авторов."""
+
+        return change_batch(
+            request, Subscribe, User.objects.exclude(id=request.user.id))
 
     @action(
         detail=False,
@@ -105,64 +235,175 @@ class UsersViewSet(UserViewSet):
     def subscriptions(self, request):
         """Получить на кого пользователь подписан."""
 
-        user = request.user
-        queryset = Subscribe.objects.filter(user=user)
+        queryset = (
+            Subscribe.objects
+            .filter(user=request.user)
+            .select_related('author'))
         pages = self.paginate_queryset(queryset)
+        author_recipes = get_author_recipes(
+            [subscribe.author_id for subscribe in pages],
+            get_recipes_limit(request))
         serializer = SubscribeSerializer(
             pages, many=True,
-            context={'request': request})
+            context={'request': request, 'author_recipes': author_recipes})
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
 
-class RecipesViewSet(ModelViewSet):
+        user = request.user
+        paginator = FeedCursorPagination()
+        # Первая страница дописывает ленту, и реплика ее еще не видит:
+        # вся лента читается с основной базы.
+        with read_from_primary():
+            if not request.query_params.get(paginator.cursor_query_param):
+                # Подтянуть популярных авторов и подрезать ленту.
+                with transaction.atomic():
+                    pull_popular(user)
+                    trim(user)
+            entries = paginator.paginate_queryset(
+                TimelineEntry.objects.filter(user=user).only(
+                    'recipe_id', 'pub_date'),
+                request, view=self)
+            recipes = get_recipes_queryset(user).in_bulk(
+                [entry.recipe_id for entry in entries])
+            serializer = RecipeReadSerializer(
+                [recipes[entry.recipe_id] for entry in entries
+                 if entry.recipe_id in recipes],
+                many=True,
+                context={'request': request, 'thumbnails': True})
+            return paginator.get_paginated_response(serializer.data)
+
+
+class RecipesViewSet(CursorPaginationMixin, ModelViewSet):
     """Работает с рецептами."""
 
     queryset = Recipe.objects.all()
+    cursor_pagination_class = RecipeCursorPagination
     filterset_class = RecipeFilter
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
     def get_serializer_class(self):
+        if self.action in MUTATION_ACTIONS:
+            return SubscribeRecipeSerializer
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # В ленте карточки маленькие - отдаем миниатюры.
+        context['thumbnails'] = self.action == 'list'
+        return context
+
+    def get_list_state(self, request, *args, **kwargs):
+        """ETag из версии кэша рецептов, без запросов к базе.
+
+        Версия меняется при любом изменении рецептов, их тэгов,
+        ингредиентов и авторов, поэтому ETag не устаревает.
+        """
+
+        user_id, lists_version = get_user_state(request)
+        etag = make_etag(
+            request.get_full_path(), get_version('recipes'),
+            user_id, lists_version)
+        return etag, None, False
+
+    def get_detail_state(self, request, *args, **kwargs):
+        try:
+            updated_at = Recipe.objects.filter(
+                pk=kwargs[self.lookup_field]
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            return None
+        if updated_at is None:
+            return None
+        user_id, lists_version = get_user_state(request)
+        etag = make_etag(request.path, updated_at, user_id, lists_version)
+        # Избранное и корзина пользователя не двигают updated_at,
+        # поэтому If-Modified-Since проверяется только для анонима.
+        return etag, updated_at, lists_version is None
+
+    @conditional(get_list_state)
+    @cache_anonymous('recipes')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(get_detail_state)
+    @cache_anonymous('recipes')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def get_queryset(self):
-        is_favorited = Exists(
-            FavoriteRecipe.objects.filter(
-                user=self.request.user, recipe=OuterRef('id')))
-        is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
-            user=self.request.user, recipe=OuterRef('id')))
-        if self.request.user.is_authenticated:
-            return Recipe.objects.annotate(
-                is_favorited, is_in_shopping_cart
-            ).select_related('author').prefetch_related(
-                'tags', 'ingredients', 'recipe', 'shopping_cart',
-                'favorite_recipe')
-        else:
-            return Recipe.objects.annotate(
-                is_in_shopping_cart=Value(False),
-                is_favorited=Value(False),
-            ).select_related('author').prefetch_related(
-                'tags', 'ingredients', 'recipe', 'shopping_cart',
-                'favorite_recipe')
+        if self.action in MUTATION_ACTIONS:
+            # Избранному и корзине нужен только id рецепта, а в ответ
+            # идет краткая карточка - без аннотаций и prefetch.
+            return Recipe.objects.only(*RECIPE_FIELDS)
+        return get_recipes_queryset(self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def add_recipe(self, model, error):
+        """Добавляет рецепт в избранное/корзину.
+
+        Счетчики рецепта обновляют сигналы в той же транзакции. Блокировка
+        пользователя - как у пачек (recipes.batch): иначе пачка и этот
+        запрос оба засчитали бы одну и ту же строку.
+        """
+
+        instance = self.get_object()
+        try:
+            with transaction.atomic():
+                lock_users([self.request.user.id])
+                model.objects.create(user=self.request.user, recipe=instance)
+        except IntegrityError:
+            return Response(
+                {'errors': error},
+                status=HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data, status=HTTP_201_CREATED)
+
+    def remove_recipe(self, model, error):
+        """Убирает рецепт из избранного/корзины."""
+
+        instance = self.get_object()
+        with transaction.atomic():
+            lock_users([self.request.user.id])
+            deleted, _ = model.objects.filter(
+                user=self.request.user, recipe=instance).delete()
+        if not deleted:
+            return Response(
+                {'errors': error},
+                status=HTTP_400_BAD_REQUEST)
+        return Response(status=HTTP_204_NO_CONTENT)
+
     @action(detail=True, permission_classes=(IsAuthenticated,))
     def favorite(self, request) -> Response:
         """Добавление и удаление рецепта в/из избранных."""
 
     @favorite.mapping.post
-    def create(self, request, *args, **kwargs):
-        instance = self.get_object()
-        request.user.favorite_recipe.recipe.add(instance)
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data, status=HTTP_201_CREATED)
+    def create_favorite(self, request, *args, **kwargs):
+        return self.add_recipe(
+            FavoriteRecipe, 'Рецепт уже в избранном!')
 
     @favorite.mapping.delete
-    def perform_destroy(self, instance):
-        self.request.user.favorite_recipe.recipe.remove(instance)
+    def delete_favorite(self, request, *args, **kwargs):
+        return self.remove_recipe(
+            FavoriteRecipe, 'Рецепта нет в избранном!')
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        """Добавление и удаление нескольких рецептов в/из избранного."""
+
+        return change_batch(request, FavoriteRecipe, Recipe.objects.all())
 
     @action(detail=True, permission_classes=(IsAuthenticated,))
     def shopping_cart_crt(self, request) -> Response:
@@ -170,43 +411,55 @@ class RecipesViewSet(ModelViewSet):
 
     @shopping_cart_crt.mapping.post
     def create_crt(self, request, *args, **kwargs):
-        instance = self.get_object()
-        request.user.shopping_cart.recipe.add(instance)
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data, status=HTTP_201_CREATED)
+        return self.add_recipe(
+            ShoppingCart, 'Рецепт уже в корзине!')
 
     @shopping_cart_crt.mapping.delete
-    def perform_crt(self, instance):
-        self.request.user.shopping_cart.recipe.remove(instance)
+    def perform_crt(self, request, *args, **kwargs):
+        return self.remove_recipe(
+            ShoppingCart, 'Рецепта нет в корзине!')
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=(IsAuthenticated,))
+    def shopping_cart(self, request):
+        """Список покупок: суммы ингредиентов всех рецептов корзины."""
+
+        items = ShoppingCartItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit')
+        return Response(ShoppingCartItemSerializer(items, many=True).data)
+
+    @shopping_cart.mapping.post
+    @shopping_cart.mapping.delete
+    def change_shopping_cart(self, request):
+        """Добавление и удаление нескольких рецептов в/из корзины."""
+
+        return change_batch(request, ShoppingCart, Recipe.objects.all())
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(TxtRenderer, CsvRenderer, PdfRenderer))
     def download_shopping_cart(self, request):
-        """Качаем список с ингредиентами."""
-
-        shopping_cart = (
-            request.user.shopping_cart.recipe.
-            values(
-                'ingredients__name',
-                'ingredients__measurement_unit'
-            ).annotate(amount=Sum('recipe__amount')).order_by())
-        if shopping_cart:
-            shopping_list = ["Список покупок:\n\n"]
-            for index, recipe in enumerate(shopping_cart, start=1):
-                ing_list = (
-                    f'{index}. {recipe["ingredients__name"]} - '
-                    f'{recipe["amount"]} '
-                    f'{recipe["ingredients__measurement_unit"]}.')
-                shopping_list.extend(ing_list)
-                shopping_list.extend('\n')
-        else:
-            shopping_list = ["Список покупок пуст!\n"]
-        response = HttpResponse(
-            shopping_list, content_type="text.txt; charset=utf-8"
-        )
-        response["Content-Disposition"] = f"attachment; filename={FILENAME}"
+        """Качаем список с ингредиентами: ?format=txt|csv|pdf."""
+
+        renderer = request.accepted_renderer
+        filename = f'{FILENAME}.{renderer.format}'
+        rows = get_shopping_list(request.user)
+        if renderer.format == 'pdf':
+            return FileResponse(
+                build_pdf(rows),
+                as_attachment=True,
+                filename=filename,
+                content_type=renderer.media_type)
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_STREAMS[renderer.format](rows),
+            content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
@@ -219,6 +472,14 @@ class TagsViewSet(
     serializer_class = TagSerializer
     http_method_names = ['get']
 
+    @cache_anonymous('tags')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous('tags')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientsViewSet(
         PermissionAndPaginationMixin,
@@ -227,4 +488,28 @@ class IngredientsViewSet(
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    filterset_class = IngredientFilter
     http_method_names = ['get']
+
+    @cache_anonymous('ingredients')
+    def list(self, request, *args, **kwargs):
+        """Поиск по ?name= из кэша в памяти, без запроса к базе."""
+
+        if not settings.INGREDIENT_INDEX_TTL:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(
+            request.query_params.get('name', '')))
+
+    @cache_anonymous('ingredients')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class MetricsView(APIView):
+    """Метрики запросов в формате Prometheus, только для админов."""
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (TxtRenderer,)
+
+    def get(self, request):
+        return Response(registry.expose())
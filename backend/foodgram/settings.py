@@ -1,4 +1,5 @@
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -39,6 +40,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.MetricsMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -85,8 +88,67 @@ DATABASES = {
         'PORT': os.getenv(
             'DB_PORT',
             default='5432'),
+        # Постоянные соединения: без TCP, авторизации и форка бэкенда
+        # Postgres на каждый запрос. Перед повторным использованием
+        # соединение проверяется, упавшее - пересоздается.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', default='True') == 'True',
+        # За PgBouncer в режиме transaction серверные курсоры .iterator()
+        # не переживают конец транзакции - их нужно отключить.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_PGBOUNCER', default='False') == 'True',
     }}
 
+# Реплика для чтения: GET-запросы читают с нее (см. api.replicas).
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv(
+            'DB_REPLICA_NAME',
+            default=DATABASES['default']['NAME']),
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv(
+            'DB_REPLICA_PORT',
+            default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Сколько секунд после записи клиент читает с основной базы.
+DB_REPLICA_PIN_SECONDS = int(
+    os.getenv('DB_REPLICA_PIN_SECONDS', default=5))
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Версии кэша ответов и ETag должны быть общими для всех процессов
+# gunicorn, поэтому в проде нужен redis (или filebased на одном хосте).
+# Кэш в памяти процесса - только для разработки и тестов.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default=(
+        LOCAL_CACHE_BACKENDS[0] if DEBUG
+        else 'django.core.cache.backends.redis.RedisCache'))
+if not DEBUG and CACHE_BACKEND in LOCAL_CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f'{CACHE_BACKEND} не виден другим процессам: задайте общий '
+        f'CACHE_BACKEND, например RedisCache.')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=(
+                'foodgram' if CACHE_BACKEND in LOCAL_CACHE_BACKENDS
+                else 'redis://redis:6379')),
+    }}
+
+ANONYMOUS_CACHE_TIMEOUT = int(
+    os.getenv('ANONYMOUS_CACHE_TIMEOUT', default=600))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -125,7 +187,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -143,3 +205,35 @@ CSRF_TRUSTED_ORIGINS = ['https://127.0.0.1:9000/', 'https://localhost/',
                         'https://paulsparrow3.ddns.net/admin/login/?next=/admin/',
                         'https://paulsparrow3.ddns.net/admin/'
                         ]
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', default=1024))
+AUTH_TOKEN_LOCAL_TTL = int(os.getenv('AUTH_TOKEN_LOCAL_TTL', default=2))
+AUTH_TOKEN_SHARED_CACHE = os.getenv(
+    'AUTH_TOKEN_SHARED_CACHE', default='False') == 'True'
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=300))
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', default=300))
+
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', default=1000))
+METRICS_PROFILE_SAMPLE_RATE = float(
+    os.getenv('METRICS_PROFILE_SAMPLE_RATE', default=0))
+METRICS_SLOW_REQUEST_SECONDS = float(
+    os.getenv('METRICS_SLOW_REQUEST_SECONDS', default=1))
+METRICS_PROFILE_DIR = os.getenv(
+    'METRICS_PROFILE_DIR',
+    default=os.path.join(BASE_DIR, 'profiles'))
+
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', default=2))
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.getenv('RECIPE_IMAGE_MAX_PIXELS', default=40_000_000))
+
+TIMELINE_SIZE = int(os.getenv('TIMELINE_SIZE', default=500))
+TIMELINE_FANOUT_LIMIT = int(
+    os.getenv('TIMELINE_FANOUT_LIMIT', default=1000))
@@ -0,0 +1,25 @@
+"""Настройки gunicorn; переопределяются переменными окружения.
+
+По умолчанию воркеры gthread: пока поток ждет базу или запись ответа
+в nginx, GIL отпущен и другие потоки того же процесса обслуживают
+запросы. Память на поток - только стек, в отличие от лишнего процесса.
+
+Каждый поток держит свое соединение с базой (CONN_MAX_AGE), и с
+репликой - еще одно к ней. Соединений к каждой базе до
+GUNICORN_WORKERS * GUNICORN_THREADS на экземпляр backend; сумма по
+всем экземплярам плюс админка и cron должна быть меньше max_connections
+PostgreSQL (100 по умолчанию). По умолчанию 3 * 4 = 12.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+# Не от числа CPU: в контейнере это CPU хоста, а от числа процессов
+# зависят память и соединения с базой.
+workers = int(os.getenv('GUNICORN_WORKERS', 3))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Перезапуск воркеров ограничивает рост памяти от фрагментации.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
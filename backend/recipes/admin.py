@@ -2,6 +2,8 @@ from django.contrib import admin
 
 from .models import (FavoriteRecipe, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Subscribe, Tag)
+from .search import search_recipes
+from .shopping_cart import rebuild_for_recipe
 
 EMPTY_MSG = '-пусто-'
 
@@ -17,13 +19,25 @@ class RecipeAdmin(admin.ModelAdmin):
         'id', 'get_author', 'name', 'text',
         'cooking_time', 'get_tags', 'get_ingredients',
         'pub_date', 'get_favorite_count')
-    search_fields = (
-        'name', 'cooking_time',
-        'author__email', 'ingredients__name')
+    search_fields = ('author__email',)
     list_filter = ('pub_date', 'tags',)
     inlines = (RecipeIngredientAdmin,)
     empty_value_display = EMPTY_MSG
 
+    def get_search_results(self, request, queryset, search_term):
+        """Почта автора - как обычно, остальное - полнотекстовым поиском."""
+
+        if not search_term or '@' in search_term:
+            return super().get_search_results(
+                request, queryset, search_term)
+        return search_recipes(queryset, search_term), False
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change and any(formset.has_changed() for formset in formsets):
+            # Суммы в списках покупок считались по старому составу.
+            rebuild_for_recipe(form.instance.pk)
+
     @admin.display(
         description='Электронная почта автора')
     def get_author(self, obj):
@@ -45,7 +59,7 @@ class RecipeAdmin(admin.ModelAdmin):
 
     @admin.display(description='В избранном')
     def get_favorite_count(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorites_count
 
 
 @admin.register(Tag)
@@ -77,32 +91,18 @@ class SubscribeAdmin(admin.ModelAdmin):
 @admin.register(FavoriteRecipe)
 class FavoriteRecipeAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'user', 'get_recipe', 'get_count')
+        'id', 'user', 'recipe', 'created')
+    search_fields = (
+        'user__email', 'recipe__name',)
+    list_select_related = ('user', 'recipe__author')
     empty_value_display = EMPTY_MSG
 
-    @admin.display(
-        description='Рецепты')
-    def get_recipe(self, obj):
-        return [
-            f'{item["name"]} ' for item in obj.recipe.values('name')[:5]]
-
-    @admin.display(
-        description='В избранных')
-    def get_count(self, obj):
-        return obj.recipe.count()
-
 
 @admin.register(ShoppingCart)
 class SoppingCartAdmin(admin.ModelAdmin):
     list_display = (
-        'id', 'user', 'get_recipe', 'get_count')
+        'id', 'user', 'recipe', 'created')
+    search_fields = (
+        'user__email', 'recipe__name',)
+    list_select_related = ('user', 'recipe__author')
     empty_value_display = EMPTY_MSG
-
-    @admin.display(description='Рецепты')
-    def get_recipe(self, obj):
-        return [
-            f'{item["name"]} ' for item in obj.recipe.values('name')[:5]]
-
-    @admin.display(description='В избранных')
-    def get_count(self, obj):
-        return obj.recipe.count()
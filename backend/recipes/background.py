@@ -0,0 +1,42 @@
+"""Фоновые задачи в пуле потоков процесса: картинки, пересборка корзин."""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    # В воркерах gthread первые запросы могут прийти одновременно.
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='background')
+    return _executor
+
+
+def run_task(func, args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception(
+            'Фоновая задача %s%s не выполнена', func.__name__, args)
+    finally:
+        connection.close()
+
+
+def run_in_background(func, *args):
+    """Задача в пуле потоков; при BACKGROUND_WORKERS=0 - сразу."""
+
+    if settings.BACKGROUND_WORKERS:
+        get_executor().submit(run_task, func, args)
+    else:
+        func(*args)
@@ -0,0 +1,75 @@
+"""Избранное, корзина и подписки пачкой.
+
+bulk_create не вызывает сигналы, а при удалении они заглушены
+(mute_relation_signals), поэтому счетчики, списки покупок и ленты
+обновляются здесь - по разу на пачку.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from recipes.counters import change_counters
+from recipes.models import (FavoriteRecipe, Recipe, ShoppingCart, Subscribe,
+                            TimelineEntry)
+from recipes.shopping_cart import lock_users, rebuild
+from recipes.signals import mute_relation_signals, touch_lists
+from recipes.timeline import backfill
+
+User = get_user_model()
+
+# Модель связи -> (поле объекта, модель объекта, счетчик объекта).
+RELATIONS = {
+    FavoriteRecipe: ('recipe', Recipe, 'favorites_count'),
+    ShoppingCart: ('recipe', Recipe, 'in_carts_count'),
+    Subscribe: ('author', User, 'followers_count'),
+}
+
+
+def get_relations(model, user, pks):
+    field, _, _ = RELATIONS[model]
+    return model.objects.filter(user=user, **{f'{field}_id__in': pks})
+
+
+@transaction.atomic
+def add(model, user, pks):
+    """Добавляет связи с объектами pks, возвращает id новых."""
+
+    field, target, counter = RELATIONS[model]
+    lock_users([user.id])
+    existing = set(get_relations(model, user, pks).values_list(
+        f'{field}_id', flat=True))
+    created = [pk for pk in pks if pk not in existing]
+    if not created:
+        return created
+    model.objects.bulk_create(
+        (model(user=user, **{f'{field}_id': pk}) for pk in created),
+        ignore_conflicts=True)
+    change_counters(target, created, counter, 1)
+    touch_lists([user.id])
+    if model is ShoppingCart:
+        rebuild([user.id])
+    elif model is Subscribe:
+        for author_id in created:
+            backfill(user.id, author_id)
+    return created
+
+
+@transaction.atomic
+def remove(model, user, pks):
+    """Удаляет связи с объектами pks, возвращает id удаленных."""
+
+    field, target, counter = RELATIONS[model]
+    lock_users([user.id])
+    relations = get_relations(model, user, pks)
+    deleted = list(relations.values_list(f'{field}_id', flat=True))
+    if not deleted:
+        return deleted
+    with mute_relation_signals():
+        relations.delete()
+    change_counters(target, deleted, counter, -1)
+    touch_lists([user.id])
+    if model is ShoppingCart:
+        rebuild([user.id])
+    elif model is Subscribe:
+        TimelineEntry.objects.filter(
+            user=user, author_id__in=deleted).delete()
+    return deleted
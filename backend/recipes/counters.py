@@ -0,0 +1,56 @@
+"""Денормализованные счетчики: избранное, корзины, рецепты, подписчики.
+
+Счетчики меняются только запросами UPDATE ... SET counter = counter + n
+в транзакции изменения связи; recount исправляет расхождения.
+"""
+import logging
+
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class CountersMixin:
+    """Обычный save() не перезаписывает счетчики модели.
+
+    Объект мог быть загружен до изменения счетчика (пользователь из кэша
+    токенов, смена пароля в djoser, форма админки), и полный save()
+    вернул бы старые значения. Поэтому при обновлении без update_fields
+    сохраняются все поля, кроме COUNTER_FIELDS.
+    """
+
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+        ):
+            skipped = {*self.COUNTER_FIELDS, *self.get_deferred_fields()}
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped]
+        super().save(*args, **kwargs)
+
+
+def change_counters(model, pks, counter, delta):
+    """Сдвигает счетчик объектов pks на delta.
+
+    В минус счетчик уходит, только если уже разошелся с данными: такие
+    объекты не меняются, а расхождение пишется в лог.
+    """
+
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{counter}__gte': -delta})
+    if queryset.update(**{counter: F(counter) + delta}) == len(pks):
+        return
+    if delta < 0:
+        drifted = list(model.objects.filter(
+            pk__in=pks, **{f'{counter}__lt': -delta}
+        ).values_list('pk', flat=True))
+        if drifted:
+            logger.warning(
+                'Счетчик %s.%s разошелся с данными у %s, запустите recount',
+                model.__name__, counter, drifted)
@@ -0,0 +1,45 @@
+"""Данные для тестов api и recipes."""
+from io import BytesIO
+
+from PIL import Image
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+def create_user(username='user'):
+    return User.objects.create_user(
+        email=f'{username}@example.com', username=username,
+        first_name='Имя', last_name='Фамилия', password='password')
+
+
+def create_tags(count):
+    return [
+        Tag.objects.create(
+            name=f'Тэг {number}', color=f'#00000{number}',
+            slug=f'tag{number}')
+        for number in range(count)]
+
+
+def create_ingredients(count):
+    return [
+        Ingredient.objects.create(
+            name=f'Ингредиент {number}', measurement_unit='г')
+        for number in range(count)]
+
+
+def create_recipe(author, name='Рецепт', ingredients=(), amount=100,
+                  tags=(), **fields):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Текст', cooking_time=10, **fields)
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient in ingredients)
+    return recipe
+
+
+def make_png(size=(800, 600)):
+    buffer = BytesIO()
+    Image.new('RGB', size, '#E26C2D').save(buffer, 'PNG')
+    return buffer.getvalue()
@@ -0,0 +1,97 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from recipes.background import run_in_background
+
+THUMB_SIZE = (480, 480)
+WEBP_WIDTHS = (320, 640, 1280)
+THUMB_DIR = 'recipes/thumbs'
+WEBP_DIR = 'recipes/webp'
+
+
+def save_image(image, name, image_format, **options):
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_variants(name):
+    """Миниатюра фиксированного размера и WebP разной ширины."""
+
+    with default_storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              or image.mode in ('LA', 'P') else 'RGB')
+    base = os.path.splitext(os.path.basename(name))[0]
+    thumb = ImageOps.fit(image, THUMB_SIZE, Image.LANCZOS).convert('RGB')
+    variants = {
+        'source': name,
+        'thumb': save_image(
+            thumb, f'{THUMB_DIR}/{base}.jpg', 'JPEG',
+            quality=85, optimize=True),
+        'webp': {},
+    }
+    for width in WEBP_WIDTHS:
+        if width > image.width and variants['webp']:
+            break
+        resized = image.copy()
+        resized.thumbnail((width, image.height), Image.LANCZOS)
+        variants['webp'][str(resized.width)] = save_image(
+            resized, f'{WEBP_DIR}/{base}-{width}.webp', 'WEBP', quality=80)
+    return variants
+
+
+def iter_variant_files(variants):
+    if variants.get('thumb'):
+        yield variants['thumb']
+    yield from variants.get('webp', {}).values()
+
+
+def delete_variants(variants):
+    """Удаляет файлы вариантов после коммита."""
+
+    names = list(iter_variant_files(variants))
+
+    def delete():
+        for name in names:
+            default_storage.delete(name)
+
+    if names:
+        transaction.on_commit(delete)
+
+
+def process_recipe_image(recipe_id):
+    """Готовит варианты картинки рецепта и удаляет устаревшие."""
+
+    from recipes.models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    variants = build_variants(recipe.image.name)
+    stale = variants
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id).first()
+        # Пока шла обработка, картинку могли заменить - тогда
+        # выбрасываем сделанные варианты.
+        if recipe is not None and recipe.image.name == variants['source']:
+            stale = recipe.image_variants
+            recipe.image_variants = variants
+            recipe.save(update_fields=['image_variants', 'updated_at'])
+    for name in iter_variant_files(stale):
+        default_storage.delete(name)
+
+
+def schedule_recipe_image(recipe_id):
+    """Обработка в фоне; при BACKGROUND_WORKERS=0 - сразу."""
+
+    run_in_background(process_recipe_image, recipe_id)
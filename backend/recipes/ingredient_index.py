@@ -0,0 +1,61 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipes.models import Ingredient
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+class IngredientIndex:
+    """Отсортированный по названию массив ингредиентов в памяти процесса.
+
+    Префиксный поиск делается бинарным поиском, поиск по подстроке -
+    проходом по оставшимся названиям. Кэш сбрасывается сигналами при
+    изменении ингредиентов и по истечении INGREDIENT_INDEX_TTL, чтобы
+    другие воркеры тоже увидели изменения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._items = None
+        self._expires = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._items = None
+
+    def _load(self):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].casefold(), item['id']))
+        keys = [item['name'].casefold() for item in items]
+        return keys, items
+
+    def _get(self):
+        with self._lock:
+            if self._keys is None or time.monotonic() > self._expires:
+                self._keys, self._items = self._load()
+                self._expires = (
+                    time.monotonic() + settings.INGREDIENT_INDEX_TTL)
+            return self._keys, self._items
+
+    def search(self, query=''):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+
+        keys, items = self._get()
+        query = query.strip().casefold()
+        if not query:
+            return list(items)
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + MAX_CHAR, lo=start)
+        return items[start:end] + [
+            item for key, item in zip(keys, items)
+            if query in key and not key.startswith(query)]
+
+
+ingredient_index = IngredientIndex()
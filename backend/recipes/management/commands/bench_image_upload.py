@@ -0,0 +1,93 @@
+import base64
+import io
+import os
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import ImageField
+
+from api.fields import StreamingBase64ImageField
+
+
+def make_data_uri(width, height, wrap):
+    """PNG из шума (почти не сжимается) в виде data URI."""
+
+    image = Image.frombytes('RGB', (width, height), os.urandom(
+        width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    if wrap:
+        encoded = '\n'.join(
+            encoded[start:start + 76] for start in range(0, len(encoded), 76))
+    return f'data:image/png;base64,{encoded}'
+
+
+def decode_whole(data):
+    """Как раньше: вся строка декодируется одной копией."""
+
+    content = base64.b64decode(data.split(',', 1)[1])
+    return ImageField().to_internal_value(
+        ContentFile(content, name='image.png'))
+
+
+class Command(BaseCommand):
+    help = ('Замер памяти и времени разбора картинки рецепта из base64: '
+            'по частям и целиком')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--width', type=int, default=1800,
+            help='Ширина картинки, по умолчанию около 10 МБ PNG.')
+        parser.add_argument(
+            '--height', type=int, default=1800)
+        parser.add_argument(
+            '--wrap', action='store_true',
+            help='Переносить base64 по 76 символов.')
+        parser.add_argument(
+            '--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        # Картинка для замера может быть больше настроек проекта.
+        settings.RECIPE_IMAGE_MAX_SIZE = 10 ** 9
+        data = make_data_uri(
+            options['width'], options['height'], options['wrap'])
+        self.stdout.write(
+            f'{options["width"]}x{options["height"]}, '
+            f'base64 {len(data) / 2 ** 20:.1f} МБ')
+        for name, decode in (
+            ('по частям', StreamingBase64ImageField().to_internal_value),
+            ('целиком', decode_whole),
+        ):
+            self.measure(name, decode, data, options['repeat'])
+
+        settings.RECIPE_IMAGE_MAX_PIXELS = (
+            options['width'] * options['height'] - 1)
+        start = time.perf_counter()
+        try:
+            StreamingBase64ImageField().to_internal_value(data)
+        except ValidationError as error:
+            self.stdout.write(
+                f'Больше RECIPE_IMAGE_MAX_PIXELS: отклонено за '
+                f'{(time.perf_counter() - start) * 1000:.1f} мс '
+                f'({error.detail[0]})')
+
+    def measure(self, name, decode, data, repeat):
+        timings = []
+        tracemalloc.start()
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                decode(data).close()
+                timings.append(time.perf_counter() - start)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.stdout.write(
+            f'{name:<12} пик памяти {peak / 2 ** 20:8.1f} МБ  '
+            f'время {min(timings) * 1000:8.1f} мс')
@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.ingredient_index import ingredient_index
+from recipes.management.commands.run_bench import percentile
+from recipes.models import Ingredient
+
+URL = '/api/ingredients/'
+
+
+class Command(BaseCommand):
+    help = ('Замер поиска ингредиентов: кэш в памяти против запроса '
+            'к базе и полной выдачи таблицы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--name', action='append',
+            help='Строка поиска, можно несколько раз.')
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Запросов на каждый замер.')
+
+    def handle(self, *args, **options):
+        if not Ingredient.objects.exists():
+            raise CommandError('Нет ингредиентов, запустите load_ingrs.')
+        names = options['name'] or ['сах', 'мол', 'соль', 'а']
+        # Анонимный кэш ответов спрятал бы разницу между способами.
+        settings.ANONYMOUS_CACHE_TIMEOUT = 0
+        client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        ttl = settings.INGREDIENT_INDEX_TTL or 300
+        self.stdout.write(f'Ингредиентов: {Ingredient.objects.count()}')
+        try:
+            for title, index_ttl, params in (
+                ('вся таблица из базы', 0, [{}]),
+                ('поиск в базе', 0, [{'name': name} for name in names]),
+                ('поиск в кэше', ttl, [{'name': name} for name in names]),
+            ):
+                settings.INGREDIENT_INDEX_TTL = index_ttl
+                ingredient_index.invalidate()
+                self.measure(
+                    title, client, params, options['requests'])
+        finally:
+            settings.INGREDIENT_INDEX_TTL = ttl
+
+    def measure(self, title, client, params, requests):
+        # Первый запрос загружает кэш и в замер не входит.
+        client.get(URL, params[0])
+        timings, queries = [], []
+        for number in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(URL, params[number % len(params)])
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{response.status_code}: {title}')
+            queries.append(len(captured))
+        self.stdout.write(
+            f'{title:<22} p50 {percentile(timings, 0.5):7.2f} мс  '
+            f'p95 {percentile(timings, 0.95):7.2f} мс  '
+            f'запросов к БД {statistics.mean(queries):.1f}')
@@ -0,0 +1,75 @@
+import statistics
+import time
+from unittest import mock
+
+import django_filters as filters
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.filters import RecipeFilter
+from api.views import RecipesViewSet
+from recipes.management.commands.run_bench import percentile
+from recipes.models import Recipe, Tag
+
+URL = '/api/recipes/'
+
+
+class JoinRecipeFilter(RecipeFilter):
+    """Фильтр тэгов, как был: JOIN по слагу и SELECT DISTINCT slug."""
+
+    tags = filters.AllValuesMultipleFilter(
+        field_name='tags__slug')
+
+
+class Command(BaseCommand):
+    help = ('Замер фильтра по тэгам: EXISTS по карте slug -> id против '
+            'прежнего JOIN по tags__slug')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Запросов на каждый замер.')
+
+    def handle(self, *args, **options):
+        slugs = list(Tag.objects.values_list('slug', flat=True))
+        if not slugs or not Recipe.objects.exists():
+            raise CommandError('Нет данных, сначала запустите seed_bench.')
+        # Анонимный кэш ответов спрятал бы разницу между способами.
+        settings.ANONYMOUS_CACHE_TIMEOUT = 0
+        client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        self.stdout.write(
+            f'Рецептов: {Recipe.objects.count()}, связей с тэгами: '
+            f'{Recipe.tags.through.objects.count()}')
+        for title, tags in (
+            ('один тэг', slugs[:1]),
+            ('все тэги', slugs),
+        ):
+            for method, filterset_class in (
+                ('EXISTS', RecipeFilter),
+                ('JOIN', JoinRecipeFilter),
+            ):
+                with mock.patch.object(
+                        RecipesViewSet, 'filterset_class', filterset_class):
+                    self.measure(
+                        f'{title}, {method}', client, {'tags': tags},
+                        options['requests'])
+
+    def measure(self, title, client, params, requests):
+        # Первый запрос загружает карту тэгов и в замер не входит.
+        client.get(URL, params)
+        timings, queries = [], []
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(URL, params)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{response.status_code}: {title}')
+            queries.append(len(captured))
+        self.stdout.write(
+            f'{title:<18} p50 {percentile(timings, 0.5):8.2f} мс  '
+            f'p95 {percentile(timings, 0.95):8.2f} мс  '
+            f'запросов к БД {statistics.mean(queries):.1f}')
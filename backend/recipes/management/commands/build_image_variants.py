@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание миниатюр и WebP-вариантов картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать варианты и для уже обработанных рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('image', 'image_variants')
+        processed = 0
+        for recipe in recipes.iterator():
+            if (
+                options['force']
+                or recipe.image_variants.get('source') != recipe.image.name
+            ):
+                process_recipe_image(recipe.pk)
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}.'))
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+
+from recipes.models import ShoppingCart
+from recipes.shopping_cart import BATCH_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчет списков покупок по корзинам пользователей'
+
+    def handle(self, *args, **options):
+        user_ids = list(ShoppingCart.objects.values_list(
+            'user_id', flat=True).order_by('user_id').distinct())
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            rebuild(user_ids[start:start + BATCH_SIZE])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано корзин: {len(user_ids)}.'))
@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from recipes.models import Subscribe
+from recipes.timeline import backfill
+
+
+class Command(BaseCommand):
+    help = 'Заполнение лент подписчиков по существующим подпискам'
+
+    def handle(self, *args, **options):
+        subscriptions = Subscribe.objects.values_list('user_id', 'author_id')
+        count = 0
+        for user_id, author_id in subscriptions.iterator():
+            backfill(user_id, author_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано подписок: {count}.'))
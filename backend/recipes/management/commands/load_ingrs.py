@@ -1,24 +1,94 @@
+import csv
 import json
+import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
+from api.cache import bump_version
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredient
 
+READ_SIZE = 64 * 1024
+
+
+def iter_csv(file):
+    """Строки csv с заголовком name,measurement_unit."""
+
+    for row in csv.DictReader(file):
+        yield row['name'], row['measurement_unit']
+
+
+def iter_json(file):
+    """Потоково разбирает json-массив объектов, не читая файл целиком."""
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается json-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный json-файл.')
+            buffer += chunk
+            continue
+        yield item['name'], item['measurement_unit']
+        buffer = buffer[end:]
+
+
+READERS = {
+    '.csv': iter_csv,
+    '.json': iter_json,
+}
+
 
 class Command(BaseCommand):
-    help = 'Загрузка из json файла'
+    help = 'Загрузка ингредиентов из csv или json файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Файл .csv или .json, по умолчанию data/ingredients.csv.')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько ингредиентов вставлять одним запросом.')
 
     def handle(self, *args, **options):
-        data_path = settings.BASE_DIR
-        with open(
-            f'{data_path}/data/ingredients.json',
-            'r',
-            encoding='utf-8'
-        ) as file:
-            data = json.load(file)
-            for ingredient in data:
-                Ingredient.objects.create(name=ingredient["name"],
-                                          measurement_unit=ingredient[
-                                              "measurement_unit"])
-        self.stdout.write(self.style.SUCCESS('Все ингредиенты загружены!'))
+        path = options['path']
+        batch_size = options['batch_size']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только .csv и .json файлы.')
+        before = Ingredient.objects.count()
+        processed = 0
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            rows = reader(file)
+            while True:
+                batch = set(islice(rows, batch_size))
+                if not batch:
+                    break
+                # Уже загруженные ингредиенты пропускаются по
+                # уникальному ограничению (name, measurement_unit).
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in batch),
+                    ignore_conflicts=True)
+                processed += len(batch)
+                self.stdout.write(f'Обработано {processed}...')
+        ingredient_index.invalidate()
+        bump_version('ingredients')
+        created = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Все ингредиенты загружены! Новых: {created}.'))
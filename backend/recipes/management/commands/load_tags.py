@@ -11,5 +11,6 @@ class Command(BaseCommand):
             {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'},
             {'name': 'Обед', 'color': '#49B64E', 'slug': 'dinner'},
             {'name': 'Ужин', 'color': '#8775D2', 'slug': 'supper'}]
-        Tag.objects.get_or_create(Tag(**tag) for tag in data)
+        for tag in data:
+            Tag.objects.get_or_create(slug=tag['slug'], defaults=tag)
         self.stdout.write(self.style.SUCCESS('Все тэги загружены!'))
@@ -0,0 +1,88 @@
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from recipes.management.commands.run_bench import percentile
+from recipes.management.commands.seed_bench import BENCH_DOMAIN
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Нагрузка на запущенный сервер: параллельные клиенты, '
+            'запросов в секунду и задержки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес сервера (gunicorn или nginx).')
+        parser.add_argument(
+            '--path', action='append',
+            help='Путь запроса, можно несколько раз; по умолчанию '
+                 '/api/recipes/?limit=6.')
+        parser.add_argument(
+            '--clients', type=int, default=16,
+            help='Параллельных клиентов.')
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность в секундах.')
+        parser.add_argument(
+            '--anonymous', action='store_true',
+            help='Без токена; иначе токены пользователей seed_bench.')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or ['/api/recipes/?limit=6']
+        tokens = [None]
+        if not options['anonymous']:
+            users = User.objects.filter(
+                email__endswith=f'@{BENCH_DOMAIN}')[:options['clients']]
+            tokens = [
+                Token.objects.get_or_create(user=user)[0].key
+                for user in users]
+            if not tokens:
+                raise CommandError(
+                    'Нет данных, сначала запустите seed_bench.')
+        self.timings, self.errors = [], 0
+        self.lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+        start = time.monotonic()
+        with ThreadPoolExecutor(options['clients']) as executor:
+            for number in range(options['clients']):
+                executor.submit(
+                    self.client, options['url'],
+                    paths[number % len(paths)],
+                    tokens[number % len(tokens)], deadline)
+        elapsed = time.monotonic() - start
+        if not self.timings:
+            raise CommandError(f'Нет успешных ответов, ошибок: {self.errors}.')
+        self.stdout.write(
+            f'{len(self.timings) / elapsed:.1f} запросов/с  '
+            f'p50 {percentile(self.timings, 0.5):.1f} мс  '
+            f'p95 {percentile(self.timings, 0.95):.1f} мс  '
+            f'среднее {statistics.mean(self.timings):.1f} мс  '
+            f'ошибок {self.errors}')
+
+    def client(self, url, path, token, deadline):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        while time.monotonic() < deadline:
+            request = urllib.request.Request(
+                url + urllib.parse.quote(path, safe='/?=&'), headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError):
+                with self.lock:
+                    self.errors += 1
+                time.sleep(0.1)
+                continue
+            with self.lock:
+                self.timings.append((time.perf_counter() - start) * 1000)
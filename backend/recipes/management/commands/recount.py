@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart, Subscribe
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, (
+        ('favorites_count', FavoriteRecipe, 'recipe'),
+        ('in_carts_count', ShoppingCart, 'recipe'))),
+    (User, (
+        ('recipes_count', Recipe, 'author'),
+        ('followers_count', Subscribe, 'author'))),
+)
+
+
+def actual_count(model, field):
+    """Подзапрос с реальным числом строк model, ссылающихся на объект."""
+
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')),
+        0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков избранного, корзин, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько объектов проверять за один запрос.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, counters in COUNTERS:
+            fixed = 0
+            last_pk = 0
+            while True:
+                pks = list(
+                    model.objects.filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                last_pk = pks[-1]
+                fixed += self.repair(model, counters, pks)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: исправлено {fixed}.')
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны!'))
+
+    def repair(self, model, counters, pks):
+        """Обновляет только объекты, у которых счетчики разошлись."""
+
+        actual = {
+            f'actual_{counter}': actual_count(source, field)
+            for counter, source, field in counters}
+        drift = Q()
+        for counter, _, _ in counters:
+            drift |= ~Q(**{counter: F(f'actual_{counter}')})
+        with transaction.atomic():
+            drifted = list(
+                model.objects.filter(pk__in=pks)
+                .annotate(**actual)
+                .filter(drift)
+                .values_list('pk', flat=True))
+            if drifted:
+                model.objects.filter(pk__in=drifted).update(**{
+                    counter: actual_count(source, field)
+                    for counter, source, field in counters})
+        return len(drifted)
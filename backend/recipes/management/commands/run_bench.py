@@ -0,0 +1,216 @@
+import json
+import platform
+import random
+import resource
+import statistics
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.management.commands.seed_bench import BENCH_DOMAIN
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+# Картинка 1x1 для создания рецептов.
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg==')
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def get_rss_mb():
+    """Текущий RSS процесса из /proc; без /proc (macOS) - пиковый."""
+
+    try:
+        with open('/proc/self/statm', encoding='ascii') as file:
+            pages = int(file.read().split()[1])
+    except OSError:
+        # ru_maxrss в Linux в КБ, в macOS - в байтах.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = ('Замер задержки, числа запросов к базе и памяти на данных '
+            'seed_bench')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Запросов на сценарий.')
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Запросов прогрева, в результат не входят.')
+        parser.add_argument(
+            '--scenario', action='append', choices=self.get_scenarios(),
+            help='Только эти сценарии (можно несколько раз).')
+        parser.add_argument(
+            '--seed', type=int, default=42)
+        parser.add_argument(
+            '--output', help='Сохранить результаты в json-файл.')
+        parser.add_argument(
+            '--compare',
+            help='json-файл прошлого замера: сообщить о регрессиях.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p95, по умолчанию 20%%.')
+
+    @staticmethod
+    def get_scenarios():
+        return [name[len('scenario_'):] for name in dir(Command)
+                if name.startswith('scenario_')]
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.users = list(User.objects.filter(
+            email__endswith=f'@{BENCH_DOMAIN}').order_by('id'))
+        if not self.users:
+            raise CommandError('Нет данных, сначала запустите seed_bench.')
+        self.tags = list(Tag.objects.values_list('slug', flat=True))
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True)[:2])
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)[:1000])
+        self.created = []
+        results = {}
+        try:
+            for name in options['scenario'] or self.get_scenarios():
+                results[name] = self.run(
+                    getattr(self, f'scenario_{name}'),
+                    options['requests'], options['warmup'])
+                self.report(name, results[name])
+        finally:
+            Recipe.objects.filter(id__in=self.created).delete()
+        data = {
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(data, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}.')
+        if options['compare']:
+            self.compare(options['compare'], results, options['threshold'])
+
+    def get_client(self):
+        user = self.rng.choice(self.users)
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def run(self, scenario, requests, warmup):
+        timings, queries = [], []
+        rss_before = get_rss_mb()
+        for number in range(warmup + requests):
+            client = self.get_client()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = scenario(client)
+                # Потоковые ответы (список покупок) дочитываются в замере.
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(
+                    f'{response.status_code}: {response.content[:200]}')
+            if number >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+        rss_after = get_rss_mb()
+        return {
+            'requests': requests,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'queries': round(statistics.mean(queries), 2),
+            'rss_mb': round(rss_after, 1),
+            'rss_delta_mb': round(rss_after - rss_before, 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<24} p50 {result["p50_ms"]:>8} мс  '
+            f'p95 {result["p95_ms"]:>8} мс  '
+            f'запросов к БД {result["queries"]:>6}  '
+            f'RSS {result["rss_mb"]} МБ ({result["rss_delta_mb"]:+})')
+
+    def compare(self, path, results, threshold):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)['scenarios']
+        regressions = []
+        for name, result in results.items():
+            before = previous.get(name)
+            if before is None:
+                continue
+            if result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+                regressions.append(
+                    f'{name}: p95 {before["p95_ms"]} -> {result["p95_ms"]} мс')
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f'{name}: запросов {before["queries"]} -> '
+                    f'{result["queries"]}')
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
+
+    def scenario_recipes(self, client):
+        return client.get(
+            '/api/recipes/', {'page': self.rng.randint(1, 20)})
+
+    def scenario_recipes_cursor(self, client):
+        return client.get('/api/recipes/', {'cursor': ''})
+
+    def scenario_recipes_tags(self, client):
+        return client.get('/api/recipes/', {
+            'tags': self.rng.sample(
+                self.tags, self.rng.randint(1, len(self.tags)))})
+
+    def scenario_recipes_favorited(self, client):
+        return client.get('/api/recipes/', {'is_favorited': 1})
+
+    def scenario_recipes_author(self, client):
+        return client.get(
+            '/api/recipes/', {'author': self.rng.choice(self.users).id})
+
+    def scenario_subscriptions(self, client):
+        return client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 3})
+
+    def scenario_download_shopping_cart(self, client):
+        return client.get('/api/recipes/download_shopping_cart/')
+
+    def scenario_recipe_create(self, client):
+        response = client.post('/api/recipes/', {
+            'name': 'Тестовый рецепт',
+            'text': 'Рецепт для замера создания.',
+            'cooking_time': 30,
+            'image': IMAGE,
+            'tags': self.tag_ids,
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 100}
+                for ingredient_id in self.rng.sample(
+                    self.ingredient_ids, 8)],
+        }, format='json')
+        if response.status_code == 201:
+            self.created.append(response.data['id'])
+        return response
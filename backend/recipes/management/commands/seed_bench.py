@@ -0,0 +1,202 @@
+import io
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from api.cache import bump_version
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Subscribe, Tag)
+from recipes.search import update_search_vector
+
+User = get_user_model()
+
+BENCH_DOMAIN = 'bench.local'
+BENCH_PASSWORD = 'bench-password'
+BENCH_IMAGE = 'recipes/images/bench.png'
+BATCH_SIZE = 1000
+DISHES = (
+    'Суп', 'Салат', 'Пирог', 'Каша', 'Рагу', 'Омлет', 'Плов',
+    'Запеканка', 'Блины', 'Котлеты', 'Паста', 'Соус')
+STEPS = (
+    'Нарезать', 'Обжарить', 'Потушить', 'Запечь', 'Смешать',
+    'Отварить', 'Взбить', 'Посолить', 'Остудить', 'Подать')
+
+
+def zipf_weights(size, exponent=1.0):
+    """Накопленные веса: несколько популярных объектов и длинный хвост."""
+
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(size)))
+
+
+def sample(rng, population, cum_weights, count):
+    """До count разных элементов с учетом весов."""
+
+    chosen = set()
+    for _ in range(count * 3):
+        if len(chosen) >= min(count, len(population)):
+            break
+        chosen.add(rng.choices(population, cum_weights=cum_weights)[0])
+    return chosen
+
+
+class Command(BaseCommand):
+    help = 'Синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Число пользователей.')
+        parser.add_argument(
+            '--recipes', type=int, default=10000,
+            help='Число рецептов.')
+        parser.add_argument(
+            '--authors', type=float, default=0.2,
+            help='Доля пользователей, публикующих рецепты.')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок на пользователя в среднем.')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Избранных рецептов на пользователя в среднем.')
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в корзине на пользователя в среднем.')
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Зерно генератора: одинаковое зерно - одинаковые данные.')
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить данные предыдущего запуска.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        bench_users = User.objects.filter(
+            email__endswith=f'@{BENCH_DOMAIN}')
+        if bench_users.exists():
+            if not options['clear']:
+                raise CommandError(
+                    'Данные для тестов уже есть, запустите с --clear.')
+            bench_users.delete()
+        if not Tag.objects.exists():
+            call_command('load_tags', stdout=self.stdout)
+        if not Ingredient.objects.exists():
+            call_command('load_ingrs', stdout=self.stdout)
+        if not default_storage.exists(BENCH_IMAGE):
+            buffer = io.BytesIO()
+            Image.new('RGB', (600, 400), '#E26C2D').save(buffer, 'PNG')
+            default_storage.save(BENCH_IMAGE, ContentFile(buffer.getvalue()))
+
+        rng = random.Random(options['seed'])
+        users = self.create_users(options['users'])
+        authors = users[:max(1, int(len(users) * options['authors']))]
+        recipes = self.create_recipes(rng, authors, options['recipes'])
+        self.create_relations(rng, users, authors, recipes, options)
+        self.stdout.write('Счетчики, поиск, ленты и списки покупок...')
+        call_command('recount', stdout=self.stdout)
+        for start in range(0, len(recipes), BATCH_SIZE):
+            update_search_vector(
+                [recipe.id for recipe in recipes[start:start + BATCH_SIZE]])
+        call_command('build_timelines', stdout=self.stdout)
+        call_command('build_shopping_carts', stdout=self.stdout)
+        bump_version('recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}.'
+            f' Пароль пользователей: {BENCH_PASSWORD}.'))
+
+    def create_users(self, count):
+        password = make_password(BENCH_PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    email=f'user{number}@{BENCH_DOMAIN}',
+                    username=f'bench{number}',
+                    first_name='Тест',
+                    last_name=f'Пользователь {number}',
+                    password=password)
+                for number in range(count)),
+            batch_size=BATCH_SIZE)
+        return list(User.objects.filter(
+            email__endswith=f'@{BENCH_DOMAIN}').order_by('id'))
+
+    def create_recipes(self, rng, authors, count):
+        ingredients = list(Ingredient.objects.order_by('id'))
+        # Популярность ингредиентов - случайная, но одна для всего запуска.
+        rng.shuffle(ingredients)
+        ingredient_weights = zipf_weights(len(ingredients), 0.8)
+        author_weights = zipf_weights(len(authors))
+        tags = list(Tag.objects.order_by('id'))
+        now = timezone.now()
+        recipes = []
+        for number in range(count):
+            chosen = sample(
+                rng, ingredients, ingredient_weights, rng.randint(3, 12))
+            names = [ingredient.name for ingredient in chosen]
+            recipe = Recipe(
+                author=rng.choices(authors, cum_weights=author_weights)[0],
+                name=f'{rng.choice(DISHES)}: {names[0]}',
+                text=' '.join(
+                    f'{rng.choice(STEPS)} {name}.' for name in names),
+                cooking_time=rng.randint(5, 180),
+                image=BENCH_IMAGE)
+            recipe.bench_ingredients = chosen
+            recipe.bench_tags = rng.sample(tags, rng.randint(1, len(tags)))
+            recipe.bench_pub_date = now - timedelta(minutes=count - number)
+            recipes.append(recipe)
+        Recipe.objects.bulk_create(recipes, batch_size=BATCH_SIZE)
+        # pub_date с auto_now_add задается только после вставки.
+        for recipe in recipes:
+            recipe.pub_date = recipe.bench_pub_date
+        Recipe.objects.bulk_update(recipes, ['pub_date'], BATCH_SIZE)
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=rng.randint(1, 1000))
+                for recipe in recipes
+                for ingredient in recipe.bench_ingredients),
+            batch_size=BATCH_SIZE)
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe in recipes
+                for tag in recipe.bench_tags),
+            batch_size=BATCH_SIZE)
+        return recipes
+
+    def create_relations(self, rng, users, authors, recipes, options):
+        author_weights = zipf_weights(len(authors))
+        recipe_weights = zipf_weights(len(recipes))
+        subscriptions, favorites, carts = [], [], []
+        for user in users:
+            subscriptions.extend(
+                Subscribe(user=user, author=author)
+                for author in sample(
+                    rng, authors, author_weights,
+                    rng.randint(0, 2 * options['subscriptions']))
+                if author != user)
+            favorites.extend(
+                FavoriteRecipe(user=user, recipe=recipe)
+                for recipe in sample(
+                    rng, recipes, recipe_weights,
+                    rng.randint(0, 2 * options['favorites'])))
+            carts.extend(
+                ShoppingCart(user=user, recipe=recipe)
+                for recipe in rng.sample(
+                    recipes,
+                    min(len(recipes), rng.randint(0, 2 * options['cart']))))
+        for model, objects in (
+            (Subscribe, subscriptions),
+            (FavoriteRecipe, favorites),
+            (ShoppingCart, carts),
+        ):
+            model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
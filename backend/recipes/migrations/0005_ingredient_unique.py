@@ -0,0 +1,58 @@
+# Generated by Django 4.1.9 on 2026-10-18 04:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Предел PositiveSmallIntegerField на всех базах, которые поддерживает Django.
+MAX_AMOUNT = 32767
+
+
+def merge_duplicates(apps, schema_editor):
+    """Повторные запуски load_ingrs плодили дубли - сливаем их.
+
+    Если в рецепте были и оригинал, и дубль, их количества складываются;
+    сумма больше MAX_AMOUNT не влезла бы в поле и обрезается до него.
+    """
+
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = (
+        Ingredient.objects
+        .values('name', 'measurement_unit')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1))
+    for group in duplicates:
+        keep_id = group['keep_id']
+        extra_ids = Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit'],
+        ).exclude(id=keep_id).values_list('id', flat=True)
+        for extra_id in extra_ids:
+            for row in RecipeIngredient.objects.filter(
+                    ingredient_id=extra_id):
+                kept = RecipeIngredient.objects.filter(
+                    recipe_id=row.recipe_id, ingredient_id=keep_id).first()
+                if kept is None:
+                    row.ingredient_id = keep_id
+                    row.save(update_fields=['ingredient'])
+                else:
+                    # В рецепте уже есть этот ингредиент - суммируем.
+                    kept.amount = min(kept.amount + row.amount, MAX_AMOUNT)
+                    kept.save(update_fields=['amount'])
+                    row.delete()
+            Ingredient.objects.filter(id=extra_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
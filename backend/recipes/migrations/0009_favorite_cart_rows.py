@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+TABLES = (
+    ('LegacyFavoriteRecipe', 'FavoriteRecipe'),
+    ('LegacyShoppingCart', 'ShoppingCart'),
+)
+
+
+def copy_rows(apps, schema_editor):
+    """Строки M2M одиночных контейнеров -> строки (user, recipe)."""
+
+    now = timezone.now()
+    for legacy_name, name in TABLES:
+        Legacy = apps.get_model('recipes', legacy_name)
+        Model = apps.get_model('recipes', name)
+        through = Legacy.recipe.through
+        container = f'{legacy_name.lower()}__user_id'
+        rows = through.objects.filter(
+            **{f'{container}__isnull': False}
+        ).values_list(container, 'recipe_id').order_by('id')
+        batch = []
+        for user_id, recipe_id in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(Model(user_id=user_id, recipe_id=recipe_id,
+                               created=now))
+            if len(batch) == BATCH_SIZE:
+                Model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Model.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def restore_containers(apps, schema_editor):
+    for legacy_name, name in TABLES:
+        Legacy = apps.get_model('recipes', legacy_name)
+        Model = apps.get_model('recipes', name)
+        through = Legacy.recipe.through
+        user_ids = Model.objects.values_list(
+            'user_id', flat=True).order_by().distinct()
+        Legacy.objects.bulk_create(
+            [Legacy(user_id=user_id) for user_id in user_ids],
+            batch_size=BATCH_SIZE)
+        containers = dict(Legacy.objects.values_list('user_id', 'id'))
+        through.objects.bulk_create(
+            (
+                through(**{
+                    f'{legacy_name.lower()}_id': containers[user_id],
+                    'recipe_id': recipe_id})
+                for user_id, recipe_id in Model.objects.values_list(
+                    'user_id', 'recipe_id').iterator()),
+            batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_timeline'),
+    ]
+
+    operations = [
+        migrations.RenameModel('FavoriteRecipe', 'LegacyFavoriteRecipe'),
+        migrations.RenameModel('ShoppingCart', 'LegacyShoppingCart'),
+        # Освобождаем related_name для новых моделей.
+        migrations.AlterField(
+            model_name='legacyfavoriterecipe',
+            name='user',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='legacyfavoriterecipe',
+            name='recipe',
+            field=models.ManyToManyField(related_name='+', to='recipes.recipe', verbose_name='Избранный рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='legacyshoppingcart',
+            name='user',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='legacyshoppingcart',
+            name='recipe',
+            field=models.ManyToManyField(related_name='+', to='recipes.recipe', verbose_name='Покупка'),
+        ),
+        migrations.CreateModel(
+            name='FavoriteRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite_recipe', to='recipes.recipe', verbose_name='Избранный рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite_recipe', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Избранный рецепт',
+                'verbose_name_plural': 'Избранные рецепты',
+                'ordering': ('-created', '-id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to='recipes.recipe', verbose_name='Покупка')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Покупка',
+                'verbose_name_plural': 'Покупки',
+                'ordering': ('-created', '-id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='favoriterecipe',
+            index=models.Index(fields=['user', '-created', '-id'], name='favorite_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite_recipe'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['user', '-created', '-id'], name='cart_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_cart_recipe'),
+        ),
+        migrations.RunPython(copy_rows, restore_containers),
+        migrations.DeleteModel('LegacyFavoriteRecipe'),
+        migrations.DeleteModel('LegacyShoppingCart'),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.1.9 on 2026-10-18 05:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_items(apps, schema_editor):
+    """Суммы ингредиентов по существующим корзинам."""
+
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartItem = apps.get_model('recipes', 'ShoppingCartItem')
+    rows = (
+        RecipeIngredient.objects
+        .filter(recipe__shopping_cart__isnull=False)
+        .values_list('recipe__shopping_cart__user_id', 'ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by())
+    ShoppingCartItem.objects.bulk_create(
+        (
+            ShoppingCartItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total)
+            for user_id, ingredient_id, total in rows.iterator()),
+        batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_items', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Список покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_item'),
+        ),
+        migrations.RunPython(fill_items, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 from django.db import models
 
+from recipes.counters import CountersMixin
+
 User = get_user_model()
 
 
@@ -17,6 +20,10 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit')]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
@@ -45,7 +52,7 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -59,6 +66,11 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         blank=True,
         null=True)
+    image_variants = models.JSONField(
+        'Миниатюра и WebP-варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False)
     text = models.TextField(
         'Описание рецепта')
     cooking_time = models.BigIntegerField(
@@ -77,11 +89,33 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         'Дата публикации',
         auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        db_index=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлений в корзину',
+        default=0,
+        editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False)
+
+    COUNTER_FIELDS = ('favorites_count', 'in_carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date', )
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx')]
 
     def __str__(self):
         return f'{self.author.email}, {self.name}'
@@ -132,6 +166,10 @@ class Subscribe(models.Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ['-id']
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='subscribe_user_id_idx')]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
@@ -141,44 +179,131 @@ class Subscribe(models.Model):
         return f'Пользователь {self.user} -> автор {self.author}'
 
 
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписчика, разложенный при публикации."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор')
+    pub_date = models.DateTimeField(
+        'Дата публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='timeline_user_pub_date_idx')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_recipe')]
+
+    def __str__(self):
+        return f'{self.user} <- {self.recipe_id}'
+
+
 class FavoriteRecipe(models.Model):
-    user = models.OneToOneField(
+    user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        null=True,
         related_name='favorite_recipe',
         verbose_name='Пользователь')
-    recipe = models.ManyToManyField(
+    recipe = models.ForeignKey(
         Recipe,
+        on_delete=models.CASCADE,
         related_name='favorite_recipe',
         verbose_name='Избранный рецепт')
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True)
 
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        ordering = ('-created', '-id')
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-id'],
+                name='favorite_user_created_idx')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite_recipe')]
 
     def __str__(self):
-        list_ = [item['name'] for item in self.recipe.values('name')]
-        return f'Пользователь {self.user} добавил {list_} в избранные.'
+        return f'Пользователь {self.user} добавил {self.recipe} в избранные.'
 
 
 class ShoppingCart(models.Model):
-    user = models.OneToOneField(
+    user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='shopping_cart',
-        null=True,
         verbose_name='Пользователь')
-    recipe = models.ManyToManyField(
+    recipe = models.ForeignKey(
         Recipe,
+        on_delete=models.CASCADE,
         related_name='shopping_cart',
         verbose_name='Покупка')
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True)
 
     class Meta:
         verbose_name = 'Покупка'
         verbose_name_plural = 'Покупки'
-        ordering = ['-id']
+        ordering = ('-created', '-id')
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-id'],
+                name='cart_user_created_idx')]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_cart_recipe')]
+
+    def __str__(self):
+        return f'Пользователь {self.user} добавил {self.recipe} в покупки.'
+
+
+class ShoppingCartItem(models.Model):
+    """Сколько ингредиента нужно на все рецепты корзины пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_items',
+        verbose_name='Пользователь')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент')
+    total_amount = models.PositiveIntegerField(
+        'Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_item')]
 
     def __str__(self):
-        list_ = [item['name'] for item in self.recipe.values('name')]
-        return f'Пользователь {self.user} добавил {list_} в покупки.'
+        return f'{self.user}: {self.ingredient} - {self.total_amount}'
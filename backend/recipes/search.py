@@ -0,0 +1,54 @@
+"""Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+Вектор хранится в Recipe.search_vector под GIN-индексом и обновляется
+после коммита записи. Поиск по нему есть только в Postgres; на других
+базах (sqlite при разработке) остается поиск подстрокой.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+
+from recipes.models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    ingredient_names = Subquery(
+        RecipeIngredient.objects
+        .filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names'))
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG))
+
+
+def update_search_vector(recipe_ids):
+    if is_supported():
+        Recipe.objects.filter(id__in=recipe_ids).update(
+            search_vector=search_vector())
+
+
+def search_recipes(queryset, text):
+    """Рецепты по запросу, самые релевантные - первыми."""
+
+    if not is_supported():
+        return queryset.filter(
+            Q(name__icontains=text)
+            | Q(text__icontains=text)
+            | Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=text)))
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query),
+    ).order_by('-rank', '-pub_date', '-id')
@@ -0,0 +1,97 @@
+"""Список покупок, собранный заранее.
+
+ShoppingCartItem хранит сумму каждого ингредиента по всем рецептам
+корзины. Добавление и удаление рецепта меняют суммы в той же транзакции,
+а правка ингредиентов или удаление рецепта пересобирает корзины в фоне
+после коммита.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.background import run_in_background
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingCartItem
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def lock_users(user_ids):
+    """Изменения корзины, избранного и подписок пользователя - по очереди."""
+
+    list(User.objects.select_for_update().filter(
+        id__in=user_ids).values_list('id', flat=True))
+
+
+@transaction.atomic
+def change_items(user_id, recipe_id, sign):
+    """Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта."""
+
+    amounts = dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+    if not amounts:
+        return
+    lock_users([user_id])
+    items = {
+        item.ingredient_id: item
+        for item in ShoppingCartItem.objects.filter(
+            user_id=user_id, ingredient_id__in=amounts)}
+    changed, emptied, created = [], [], []
+    for ingredient_id, amount in amounts.items():
+        item = items.get(ingredient_id)
+        if item is None:
+            if sign > 0:
+                created.append(ShoppingCartItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=amount))
+            continue
+        item.total_amount += sign * amount
+        if item.total_amount > 0:
+            changed.append(item)
+        else:
+            emptied.append(item.id)
+    if changed:
+        ShoppingCartItem.objects.bulk_update(changed, ['total_amount'])
+    if emptied:
+        ShoppingCartItem.objects.filter(id__in=emptied).delete()
+    ShoppingCartItem.objects.bulk_create(created)
+
+
+@transaction.atomic
+def rebuild(user_ids):
+    """Пересчитывает списки покупок пользователей по их корзинам."""
+
+    user_ids = list(user_ids)
+    lock_users(user_ids)
+    ShoppingCartItem.objects.filter(user_id__in=user_ids).delete()
+    rows = (
+        RecipeIngredient.objects
+        .filter(recipe__shopping_cart__user_id__in=user_ids)
+        .values_list('recipe__shopping_cart__user_id', 'ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by())
+    ShoppingCartItem.objects.bulk_create(
+        (
+            ShoppingCartItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total)
+            for user_id, ingredient_id, total in rows.iterator()),
+        batch_size=BATCH_SIZE)
+
+
+def rebuild_in_batches(user_ids):
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        rebuild(user_ids[start:start + BATCH_SIZE])
+
+
+def rebuild_for_recipe(recipe_id):
+    """После коммита пересобирает в фоне корзины, в которых лежит рецепт."""
+
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+    if user_ids:
+        transaction.on_commit(
+            lambda: run_in_background(rebuild_in_batches, user_ids))
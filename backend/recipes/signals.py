@@ -0,0 +1,225 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api.cache import bump_lists_version
+from recipes.counters import change_counters
+from recipes.images import delete_variants, schedule_recipe_image
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            Subscribe, Tag)
+from recipes.search import update_search_vector
+from recipes.shopping_cart import change_items, rebuild_for_recipe
+from recipes.timeline import backfill, fan_out, remove_author
+
+User = get_user_model()
+
+relation_signals_muted = ContextVar('relation_signals_muted', default=False)
+
+
+@contextmanager
+def mute_relation_signals():
+    """Сигналы избранного, корзины и подписок не обрабатываются.
+
+    Для пачек (recipes.batch): счетчики, списки покупок и ленты там
+    обновляются один раз на пачку, а не на каждую строку.
+    """
+
+    token = relation_signals_muted.set(True)
+    try:
+        yield
+    finally:
+        relation_signals_muted.reset(token)
+
+
+def unless_muted(func):
+    @wraps(func)
+    def wrapper(**kwargs):
+        if not relation_signals_muted.get():
+            func(**kwargs)
+    return wrapper
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        change_counters(User, [instance.author_id], 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(instance, **kwargs):
+    """Варианты картинки готовятся вне запроса, после коммита."""
+
+    if (
+        instance.image
+        and instance.image_variants.get('source') != instance.image.name
+    ):
+        transaction.on_commit(
+            lambda: schedule_recipe_image(instance.pk))
+
+
+@receiver(pre_save, sender=Recipe)
+def drop_replaced_image_variants(instance, **kwargs):
+    """Варианты старой картинки не показываются и удаляются."""
+
+    source = instance.image_variants.get('source')
+    if source and source != instance.image.name:
+        delete_variants(instance.image_variants)
+        instance.image_variants = {}
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_variants(instance, **kwargs):
+    delete_variants(instance.image_variants)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    change_counters(User, [instance.author_id], 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: fan_out(instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_search_vector(instance, **kwargs):
+    """Вектор пересчитывается после коммита, когда записаны ингредиенты."""
+
+    transaction.on_commit(lambda: update_search_vector([instance.pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_search_vectors(instance, created, **kwargs):
+    if not created:
+        recipe_ids = list(Recipe.objects.filter(
+            ingredients=instance).values_list('id', flat=True))
+        transaction.on_commit(lambda: update_search_vector(recipe_ids))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@unless_muted
+def increment_favorites_count(instance, created, **kwargs):
+    if created:
+        change_counters(Recipe, [instance.recipe_id], 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@unless_muted
+def decrement_favorites_count(instance, **kwargs):
+    change_counters(Recipe, [instance.recipe_id], 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@unless_muted
+def increment_in_carts_count(instance, created, **kwargs):
+    if created:
+        change_counters(Recipe, [instance.recipe_id], 'in_carts_count', 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+@unless_muted
+def decrement_in_carts_count(instance, **kwargs):
+    change_counters(Recipe, [instance.recipe_id], 'in_carts_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@unless_muted
+def add_shopping_cart_items(instance, created, **kwargs):
+    if created:
+        change_items(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+@unless_muted
+def remove_shopping_cart_items(instance, **kwargs):
+    change_items(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def rebuild_shopping_carts_on_delete(instance, **kwargs):
+    # При каскадном удалении ингредиенты рецепта могут исчезнуть раньше
+    # строк корзины, и вычитать будет нечего.
+    rebuild_for_recipe(instance.pk)
+
+
+@receiver(post_save, sender=Subscribe)
+@unless_muted
+def increment_followers_count(instance, created, **kwargs):
+    if created:
+        change_counters(User, [instance.author_id], 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscribe)
+@unless_muted
+def decrement_followers_count(instance, **kwargs):
+    change_counters(User, [instance.author_id], 'followers_count', -1)
+
+
+@receiver(post_save, sender=Subscribe)
+@unless_muted
+def backfill_timeline(instance, created, **kwargs):
+    if created:
+        backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+@unless_muted
+def clean_timeline(instance, **kwargs):
+    remove_author(instance.user_id, instance.author_id)
+
+
+def touch_lists(user_ids):
+    bump_lists_version(user_ids)
+
+
+@receiver((post_save, post_delete), sender=Subscribe)
+@unless_muted
+def touch_subscriber_lists(instance, **kwargs):
+    touch_lists([instance.user_id])
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@unless_muted
+def touch_owner_lists(instance, **kwargs):
+    """Избранное и корзина влияют на is_favorited/is_in_shopping_cart."""
+
+    touch_lists([instance.user_id])
+
+
+# Тэги, ингредиенты и автор входят в представление рецепта, поэтому их
+# изменение сдвигает updated_at рецептов (а значит, и их ETag).
+@receiver((post_save, pre_delete), sender=Tag)
+def touch_tag_recipes(instance, created=False, **kwargs):
+    if not created:
+        Recipe.objects.filter(tags=instance).update(
+            updated_at=timezone.now())
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def touch_ingredient_recipes(instance, created=False, **kwargs):
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update(
+            updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, update_fields=None, **kwargs):
+    if not created and instance.author_fields_changed(update_fields):
+        Recipe.objects.filter(author=instance).update(
+            updated_at=timezone.now())
@@ -0,0 +1,132 @@
+import shutil
+import tempfile
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from recipes.counters import change_counters
+from recipes.factories import (create_ingredients, create_recipe,
+                               create_user, make_png)
+from recipes.images import iter_variant_files
+from recipes.models import (FavoriteRecipe, Recipe, ShoppingCart,
+                            TimelineEntry)
+from recipes.timeline import trim
+from users.models import User
+
+
+class CountersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+
+    def test_stale_save_keeps_counters(self):
+        stale_user = User.objects.get(pk=self.user.pk)
+        recipe = create_recipe(self.user)
+        stale_recipe = Recipe.objects.get(pk=recipe.pk)
+        FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+
+        # Как djoser set_password и правка рецепта: полный save().
+        stale_user.set_password('new-password')
+        stale_user.save()
+        stale_recipe.name = 'Новое название'
+        stale_recipe.save()
+
+        self.user.refresh_from_db()
+        recipe.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 1)
+        self.assertTrue(self.user.check_password('new-password'))
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.name, 'Новое название')
+
+    def test_drift_is_logged(self):
+        with self.assertLogs('recipes.counters', 'WARNING'):
+            change_counters(User, [self.user.pk], 'followers_count', -1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.followers_count, 0)
+
+
+class TimelineTest(TestCase):
+
+    @override_settings(TIMELINE_SIZE=2)
+    def test_trim_keeps_ties_above_boundary(self):
+        user, author = create_user(), create_user('author')
+        pub_date = timezone.now()
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(
+                user=user, recipe=create_recipe(author), author=author,
+                pub_date=pub_date)
+            for _ in range(4))
+        kept = list(user.timeline.values_list('id', flat=True)[:2])
+
+        trim(user)
+
+        self.assertEqual(
+            list(user.timeline.values_list('id', flat=True)), kept)
+
+
+@override_settings(BACKGROUND_WORKERS=0)
+class ShoppingCartTest(APITestCase):
+
+    def test_ingredient_edit_rebuilds_carts(self):
+        author, buyer = create_user(), create_user('buyer')
+        ingredients = create_ingredients(3)
+        recipe = create_recipe(author, ingredients=ingredients[:2])
+        ShoppingCart.objects.create(user=buyer, recipe=recipe)
+        self.client.force_authenticate(author)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {'ingredients': [
+                    {'id': ingredients[0].id, 'amount': 300},
+                    {'id': ingredients[2].id, 'amount': 50}]},
+                format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(buyer.shopping_cart_items.values_list(
+                'ingredient_id', 'total_amount')),
+            {ingredients[0].id: 300, ingredients[2].id: 50})
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(name):
+    return SimpleUploadedFile(name, make_png(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class ImageVariantsTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def get_variant_files(self, recipe):
+        recipe.refresh_from_db()
+        names = list(iter_variant_files(recipe.image_variants))
+        self.assertTrue(names)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        return names
+
+    def test_replace_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(
+                create_user(), image=make_image('first.png'))
+        old = self.get_variant_files(recipe)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image = make_image('second.png')
+            recipe.save()
+        new = self.get_variant_files(recipe)
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in new))
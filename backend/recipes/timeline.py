@@ -0,0 +1,97 @@
+"""Лента рецептов от авторов, на которых подписан пользователь.
+
+Новый рецепт сразу раскладывается по лентам подписчиков (fan-out on
+write), и чтение ленты - один проход по индексу (user, pub_date, id).
+У популярных авторов (от TIMELINE_FANOUT_LIMIT подписчиков) рассылка
+слишком дорогая: их рецепты подтягиваются в ленту при ее чтении.
+"""
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Max, Q
+
+from recipes.models import Recipe, Subscribe, TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def add_entries(user_ids, recipes):
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe.id,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date)
+            for user_id in user_ids
+            for recipe in recipes),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True)
+
+
+def is_popular(author):
+    return author.followers_count >= settings.TIMELINE_FANOUT_LIMIT
+
+
+def fan_out(recipe_id):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+
+    recipe = Recipe.objects.select_related('author').only(
+        'id', 'pub_date', 'author__followers_count').filter(
+        id=recipe_id).first()
+    if recipe is None or is_popular(recipe.author):
+        return
+    add_entries(
+        Subscribe.objects.filter(author_id=recipe.author_id).values_list(
+            'user_id', flat=True).iterator(chunk_size=BATCH_SIZE),
+        (recipe,))
+
+
+def backfill(user_id, author_id):
+    """После подписки в ленту попадают последние рецепты автора."""
+
+    add_entries((user_id,), Recipe.objects.filter(
+        author_id=author_id).only('id', 'author_id', 'pub_date').order_by(
+        '-pub_date', '-id')[:settings.TIMELINE_SIZE])
+
+
+def remove_author(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def pull_popular(user):
+    """Fan-out on read: новые рецепты популярных авторов из подписок."""
+
+    author_ids = list(user.follower.filter(
+        author__followers_count__gte=settings.TIMELINE_FANOUT_LIMIT
+    ).values_list('author_id', flat=True))
+    if not author_ids:
+        return
+    # Раньше этих рецептов все есть в ленте: из рассылки или backfill.
+    pulled = dict(TimelineEntry.objects.filter(
+        user=user, author_id__in=author_ids
+    ).values_list('author_id').annotate(Max('pub_date')).order_by())
+    condition = reduce(or_, (
+        Q(author_id=author_id, pub_date__gt=pulled[author_id])
+        if author_id in pulled else Q(author_id=author_id)
+        for author_id in author_ids))
+    add_entries((user.id,), Recipe.objects.filter(condition).only(
+        'id', 'author_id', 'pub_date').order_by(
+        '-pub_date', '-id')[:settings.TIMELINE_SIZE])
+
+
+def trim(user):
+    """Оставляет в ленте не больше TIMELINE_SIZE последних записей.
+
+    Граница - по ключу курсора (pub_date, id): записи с той же датой,
+    что у границы, но выше нее в ленте, остаются.
+    """
+
+    boundary = user.timeline.values_list('pub_date', 'id')[
+        settings.TIMELINE_SIZE:settings.TIMELINE_SIZE + 1]
+    if boundary:
+        pub_date, entry_id = boundary[0]
+        user.timeline.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lte=entry_id)
+        ).delete()
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.9 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='lists_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Изменение избранного, корзины и подписок'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.9 on 2026-10-18 05:26
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_lists_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='lists_updated_at',
+        ),
+    ]
@@ -1,8 +1,13 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from recipes.counters import CountersMixin
 
-class User(AbstractUser):
+# Поля пользователя, которые видны в карточке рецепта.
+AUTHOR_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(
         'Email',
         max_length=200,
@@ -13,9 +18,18 @@ class User(AbstractUser):
     last_name = models.CharField(
         'Фамилия',
         max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+    COUNTER_FIELDS = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -24,3 +38,26 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.email
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_author_fields = instance.get_author_fields()
+        return instance
+
+    def get_author_fields(self):
+        # Через __dict__, чтобы не догружать отложенные поля.
+        return {field: self.__dict__.get(field) for field in AUTHOR_FIELDS}
+
+    def author_fields_changed(self, update_fields=None):
+        """Изменились ли при сохранении поля, видные в рецептах автора."""
+
+        if update_fields is not None and not AUTHOR_FIELDS & set(
+                update_fields):
+            return False
+        return getattr(
+            self, '_loaded_author_fields', None) != self.get_author_fields()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_author_fields = self.get_author_fields()